@@ -3,18 +3,25 @@ Career Matcher - Quiz-based career matching system with AI capabilities
 Handles 10-question career quiz and generates comprehensive career roadmaps with AI
 """
 
-import pandas as pd
 import numpy as np
+import csv
+import io
 import json
+import orjson
 import os
+import re
+import time
+import hashlib
 import httpx
 from loguru import logger
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple
-from sklearn.metrics.pairwise import cosine_similarity
-from sklearn.preprocessing import StandardScaler
+from typing import Callable, Dict, List, Optional, Tuple
+from collections import OrderedDict, deque
+from datetime import datetime, timezone
+from functools import cached_property
 import asyncio
 from dotenv import load_dotenv
+from distiller import COHERE_EMBED_BATCH
 
 # Load environment variables
 load_dotenv()
@@ -22,6 +29,131 @@ load_dotenv()
 # RIASEC interest dimensions
 RIASEC = ["realistic", "investigative", "artistic", "social", "enterprising", "conventional"]
 
+# Concurrent Cohere embed requests and retries on 429 rate limits
+COHERE_MAX_CONCURRENCY = 4
+COHERE_MAX_RETRIES = 2
+
+# Max cached user profile embeddings per process
+EMBEDDING_CACHE_CAPACITY = 4096
+
+# Groq free tier allows 30 requests/minute; stay under it client-side instead of eating 429s
+GROQ_MAX_REQUESTS_PER_MINUTE = 25
+GROQ_MAX_RETRIES = 2
+
+GROQ_CHAT_URL = "https://api.groq.com/openai/v1/chat/completions"
+# Groq model used for all generations; part of the generation cache key
+GROQ_MODEL = "llama3-8b-8192"
+
+# Sections of the comprehensive analysis, as returned by the combined Groq prompt
+ANALYSIS_SECTIONS = ("ai_roadmap", "interview_preparation", "market_insights", "learning_plan")
+
+# Max cached Groq generations (roadmaps, interview prep, ...) per process
+GENERATION_CACHE_CAPACITY = 1024
+
+# Generation cache (memory and data/generation_cache): entries expire so market text refreshes,
+# and the oldest files are evicted past the cap since keys include free-form user skills
+GENERATION_DISK_CACHE_TTL_SECONDS = 24 * 60 * 60
+GENERATION_DISK_CACHE_MAX_FILES = 4096
+
+# Whole comprehensive analyses keyed by (answers, skills); same quiz result -> same analysis
+ANALYSIS_CACHE_TTL_SECONDS = 24 * 60 * 60
+ANALYSIS_CACHE_CAPACITY = 1024
+
+# Career embeddings are unit vectors, so half precision loses nothing that matters for ranking
+# and halves the matrix in RAM and on disk; scoring upcasts to float32
+CAREER_EMBEDDING_DTYPE = np.float16
+
+# Basic matching runs its title-diversity filter over this many candidates per requested match
+DIVERSITY_POOL_FACTOR = 10
+
+# Fallback embedding: size matches Cohere's light model; first five slots hold text features
+FALLBACK_EMBEDDING_DIM = 384
+# Term -> feature slots (0 technical, 1 framework, 2 learning); 'method' counts in two groups
+_FALLBACK_TERM_SLOTS: Dict[str, Tuple[int, ...]] = {}
+for _slot, _terms in enumerate((
+    ('api', 'database', 'algorithm', 'function', 'class', 'method', 'variable', 'loop', 'condition', 'error'),
+    ('react', 'python', 'javascript', 'docker', 'kubernetes', 'aws', 'azure', 'node', 'express', 'fastapi'),
+    ('learn', 'understand', 'practice', 'example', 'tutorial', 'guide', 'step', 'process', 'method'),
+)):
+    for _term in _terms:
+        _FALLBACK_TERM_SLOTS[_term] = _FALLBACK_TERM_SLOTS.get(_term, ()) + (_slot,)
+
+def _loads_json(text: str):
+    """Parse JSON with orjson, falling back to stdlib json for the extras it accepts (NaN, Infinity)"""
+    try:
+        return orjson.loads(text)
+    except orjson.JSONDecodeError:
+        return json.loads(text)
+
+_JSON_FENCE_RE = re.compile(r"^\s*```(?:json)?\s*|\s*```\s*$", re.IGNORECASE)
+_TRAILING_COMMA_RE = re.compile(r",\s*([}\]])")
+
+def _parse_llm_json(text: str) -> Optional[Dict]:
+    """Best-effort parse of a JSON object from model output.
+    Strips markdown fences, then retries on the outermost {...} block with trailing commas
+    removed (and single quotes swapped when there are no double quotes). Returns None on failure."""
+    if not text:
+        return None
+    text = _JSON_FENCE_RE.sub("", text)
+    try:
+        parsed = _loads_json(text)
+        return parsed if isinstance(parsed, dict) else None
+    except ValueError:
+        pass
+    
+    start, end = text.find("{"), text.rfind("}")
+    if start == -1 or end <= start:
+        return None
+    candidate = _TRAILING_COMMA_RE.sub(r"\1", text[start:end + 1])
+    if '"' not in candidate:
+        candidate = candidate.replace("'", '"')
+    try:
+        parsed = _loads_json(candidate)
+        return parsed if isinstance(parsed, dict) else None
+    except ValueError:
+        return None
+
+class _RateLimiter:
+    """Async sliding-window limiter: at most max_calls entries per period seconds; callers queue in order"""
+    def __init__(self, max_calls: int, period: float):
+        self.max_calls = max_calls
+        self.period = period
+        self._calls: deque = deque()
+        self._lock = asyncio.Lock()
+    
+    async def __aenter__(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                while self._calls and now - self._calls[0] >= self.period:
+                    self._calls.popleft()
+                if len(self._calls) < self.max_calls:
+                    self._calls.append(now)
+                    return self
+                await asyncio.sleep(self.period - (now - self._calls[0]))
+    
+    async def __aexit__(self, *exc):
+        return False
+
+def _compact_prompt(prompt: str) -> str:
+    """Drop the source indentation of triple-quoted prompts; it is pure input-token overhead"""
+    return "\n".join(line.strip() for line in prompt.strip().splitlines())
+
+def _unit_rows(matrix: np.ndarray) -> np.ndarray:
+    """L2-normalize each row (zero rows stay zero) so cosine similarity is a plain dot product"""
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+def _top_k_indices(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k highest scores, best first, using O(n) partial selection"""
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.intp)
+    idx = np.argpartition(-scores, k - 1)[:k]
+    return idx[np.argsort(-scores[idx], kind="stable")]
+
 class CareerMatcher:
     def __init__(self):
         """Initialize career matcher with data and AI capabilities"""
@@ -29,29 +161,107 @@ class CareerMatcher:
         
         # Load career data
         self.career_data = self._load_career_data()
+        self._riasec_matrix = self._build_riasec_matrix(self.career_data)
+        self._career_columns = self._extract_career_columns(self.career_data)
+        # Static per-career matching inputs, built once instead of per career per request
+        self._career_texts = [self._build_career_text(self._career_record(i)) for i in range(len(self.career_data))]
+        self._career_texts_lower = [text.lower() for text in self._career_texts]
+        self._career_skill_text = [self._join_skills(skills) for skills in self._career_columns["top_skills"]]
         
-        # Load quiz questions
-        self.quiz_questions = self._load_quiz_questions()
-        
-        # Load career roadmaps
-        self.career_roadmaps = self._load_career_roadmaps()
+        # Quiz questions and career roadmaps are loaded on first use (see the cached properties below)
         
         # Initialize API helpers
         self.cohere_api_key = os.getenv("COHERE_API_KEY")
         self.groq_api_key = os.getenv("GROQ_API_KEY")
         
+        # Pooled Cohere / Groq clients, created lazily inside the running event loop
+        self._http: Optional[httpx.AsyncClient] = None
+        self._groq_http: Optional[httpx.AsyncClient] = None
+        self._groq_limiter = _RateLimiter(GROQ_MAX_REQUESTS_PER_MINUTE, 60.0)
+        self._embed_semaphore = asyncio.Semaphore(COHERE_MAX_CONCURRENCY)
+        
+        # Career embedding matrix [n_careers, dim]; loaded from disk or built on first match
+        self._career_matrix: Optional[np.ndarray] = None
+        # User profile text -> embedding (LRU); quiz answers collapse to a small set of profiles
+        self._embedding_cache: "OrderedDict[bytes, List[float]]" = OrderedDict()
+        # Prompt digest -> (monotonic time, parsed Groq JSON) (LRU + TTL); the same top careers recur across users
+        self._generation_cache: "OrderedDict[bytes, Tuple[float, Dict]]" = OrderedDict()
+        # (answers, sorted skills) digest -> (monotonic time, comprehensive analysis) (LRU + TTL)
+        self._analysis_cache: "OrderedDict[bytes, Tuple[float, Dict]]" = OrderedDict()
+        
         logger.info("CareerMatcher initialized successfully with embedding capabilities")
     
-    def _load_career_data(self) -> pd.DataFrame:
-        """Load career data from CSV"""
+    def _load_career_data(self) -> List[Dict[str, str]]:
+        """Load career data rows from CSV"""
         try:
-            df = pd.read_csv(self.data_path / "onet_bls_trimmed.csv")
-            logger.info(f"Loaded {len(df)} careers")
-            return df
+            csv_path = self.data_path / "onet_bls_trimmed.csv"
+            raw = csv_path.read_bytes()
+            # Content hash of the dataset keys the on-disk career embedding cache
+            self._career_data_digest = hashlib.sha1(raw).hexdigest()[:16]
+            rows = list(csv.DictReader(io.StringIO(raw.decode("utf-8-sig"))))
+            logger.info(f"Loaded {len(rows)} careers")
+            return rows
         except FileNotFoundError:
             logger.error("Career data not found. Please run process_dataset.py first.")
             raise FileNotFoundError("Career data file not found")
     
+    @staticmethod
+    def _build_riasec_matrix(rows: List[Dict[str, str]]) -> np.ndarray:
+        """Row-normalized [n_careers, 6] RIASEC matrix so basic matching is a single matmul"""
+        matrix = np.array([[float(row.get(dim) or 0) for dim in RIASEC] for row in rows], dtype=np.float32)
+        return _unit_rows(matrix.reshape(len(rows), len(RIASEC)))
+    
+    @staticmethod
+    def _numeric_column(values: List[str]) -> list:
+        """Parse a CSV column as ints when every value is integral, else floats; blanks become 0"""
+        try:
+            return [int(v) if v else 0 for v in values]
+        except ValueError:
+            return [float(v) if v else 0.0 for v in values]
+    
+    @classmethod
+    def _extract_career_columns(cls, rows: List[Dict[str, str]]) -> Dict[str, list]:
+        """Column-wise plain lists of the career fields we return, indexed by row position"""
+        columns = {}
+        for col in ("title", "top_skills", "day_in_life"):
+            columns[col] = [row.get(col) or "" for row in rows]
+        for col in ("salary_low", "salary_high", "growth_pct"):
+            columns[col] = cls._numeric_column([(row.get(col) or "").strip() for row in rows])
+        return columns
+    
+    @staticmethod
+    def _join_skills(career_skills: str) -> str:
+        """Lowercased skills joined by a unit separator, so one substring test covers every skill"""
+        return "\x1f".join(skill.strip().lower() for skill in career_skills.split(',')) if career_skills else ""
+    
+    def _career_record(self, i: int) -> Dict:
+        """Career fields for row i, as returned in match results"""
+        cols = self._career_columns
+        return {
+            "title": cols["title"][i],
+            "salary_low": cols["salary_low"][i],
+            "salary_high": cols["salary_high"][i],
+            "growth_pct": cols["growth_pct"][i],
+            "top_skills": cols["top_skills"][i],
+            "day_in_life": cols["day_in_life"][i]
+        }
+    
+    @cached_property
+    def quiz_questions(self) -> List[Dict]:
+        return self._load_quiz_questions()
+    
+    @cached_property
+    def _scoring_lut(self) -> np.ndarray:
+        return self._build_scoring_lut(self.quiz_questions)
+    
+    @cached_property
+    def career_roadmaps(self) -> Dict:
+        return self._load_career_roadmaps()
+    
+    @cached_property
+    def _roadmap_title_index(self) -> Tuple[Dict[str, int], Dict[str, int]]:
+        return self._build_title_masks(self.career_roadmaps)
+    
     def _load_quiz_questions(self) -> List[Dict]:
         """Load quiz questions from JSON"""
         try:
@@ -62,6 +272,17 @@ class CareerMatcher:
             logger.error("Quiz questions not found")
             raise FileNotFoundError("Quiz questions file not found")
     
+    @staticmethod
+    def _build_scoring_lut(questions: List[Dict]) -> np.ndarray:
+        """[question, option, RIASEC dimension] score table so answer scoring is one gather + sum"""
+        riasec_index = {dim: i for i, dim in enumerate(RIASEC)}
+        lut = np.zeros((len(questions), len(RIASEC), len(RIASEC)), dtype=np.float32)
+        for q, question in enumerate(questions):
+            for a, option in enumerate(question["options"][:len(RIASEC)]):
+                for dimension, score in option["score"].items():
+                    lut[q, a, riasec_index[dimension]] += score
+        return lut
+    
     def _load_career_roadmaps(self) -> Dict:
         """Load career roadmaps from JSON"""
         try:
@@ -126,22 +347,15 @@ class CareerMatcher:
         """Get all quiz questions"""
         return self.quiz_questions
     
-    @staticmethod
-    def answers_to_vec(answers: List[int]) -> np.ndarray:
+    def answers_to_vec(self, answers: List[int]) -> np.ndarray:
         """Convert quiz answers to RIASEC vector"""
         if len(answers) != 10:
             raise ValueError("Must provide exactly 10 answers")
         
-        vec = np.zeros(6)  # 6 RIASEC dimensions
-        
-        for i, answer in enumerate(answers):
-            if 0 <= answer < len(RIASEC):
-                question = CareerMatcher().quiz_questions[i]
-                selected_option = question["options"][answer]
-                scores = selected_option["score"]
-                
-                for dimension, score in scores.items():
-                    vec[RIASEC.index(dimension)] += score
+        # Out-of-range answers contribute nothing, as before
+        answer_idx = np.asarray(answers)
+        valid = (answer_idx >= 0) & (answer_idx < len(RIASEC))
+        vec = self._scoring_lut[np.nonzero(valid)[0], answer_idx[valid]].sum(axis=0)
         
         # Normalize to unit length
         norm = np.linalg.norm(vec)
@@ -159,21 +373,25 @@ class CareerMatcher:
             # Create comprehensive user profile
             user_profile = await self._create_user_profile(answers, user_skills, user_interests)
             
-            # Generate user profile embedding
-            user_embedding = await self._generate_user_embedding(user_profile)
+            # Embed the user profile while the career matrix loads (or is embedded on first use)
+            user_embedding, career_matrix = await asyncio.gather(
+                self._generate_user_embedding(user_profile),
+                self._load_or_build_career_embeddings(self._career_texts)
+            )
             
-            # Get career embeddings and calculate similarities
-            similarities = await self._calculate_career_similarities(user_embedding, user_profile)
+            # Calculate similarities against every career
+            similarities = self._calculate_career_similarities(user_embedding, user_profile, career_matrix)
             
-            # Sort by similarity and return top matches
-            similarities.sort(key=lambda x: x["similarity"], reverse=True)
+            # Select the top matches without sorting the whole list
+            scores = np.fromiter((m["similarity"] for m in similarities), dtype=np.float32, count=len(similarities))
+            top_matches = [similarities[i] for i in _top_k_indices(scores, top_k)]
             
             # If all similarities are too low, use basic matching
-            if similarities and similarities[0]["similarity"] < 0.3:
+            if top_matches and top_matches[0]["similarity"] < 0.3:
                 logger.warning("Embedding similarities too low, using basic RIASEC matching")
                 return self._get_basic_career_matches(answers, top_k)
             
-            return similarities[:top_k]
+            return top_matches
             
         except Exception as e:
             logger.error(f"Embedding-based career matching failed: {e}")
@@ -301,68 +519,61 @@ class CareerMatcher:
             Career Goals: {', '.join(user_profile['career_goals'])}
             """
             
+            cache_key = hashlib.blake2b(profile_text.encode("utf-8"), digest_size=16).digest()
+            cached = self._embedding_cache.get(cache_key)
+            if cached is not None:
+                self._embedding_cache.move_to_end(cache_key)
+                return cached
+            
             # Use Cohere API for embedding
-            url = "https://api.cohere.ai/v1/embed"
-            headers = {
-                "Authorization": f"Bearer {self.cohere_api_key}",
-                "Content-Type": "application/json"
-            }
-            payload = {
-                "model": "embed-english-light-v3.0",
-                "texts": [profile_text],
-                "input_type": "search_document"
-            }
+            embeddings = await self._embed_batch([profile_text])
+            if not embeddings:
+                return self._generate_fallback_embedding(profile_text)
             
-            async with httpx.AsyncClient() as client:
-                res = await client.post(url, headers=headers, json=payload)
-                res.raise_for_status()
-                embeddings = res.json()["embeddings"]
-                return embeddings[0] if embeddings else self._generate_fallback_embedding(profile_text)
+            # Only real API embeddings are cached; fallbacks are retried next time
+            self._embedding_cache[cache_key] = embeddings[0]
+            while len(self._embedding_cache) > EMBEDDING_CACHE_CAPACITY:
+                self._embedding_cache.popitem(last=False)
+            return embeddings[0]
                 
         except Exception as e:
             logger.error(f"Failed to generate user embedding: {e}")
             return self._generate_fallback_embedding(str(user_profile))
     
-    async def _calculate_career_similarities(self, user_embedding: List[float], user_profile: Dict) -> List[Dict]:
-        """Calculate similarities between user and all careers"""
-        similarities = []
-        
-        for _, career in self.career_data.iterrows():
-            try:
-                # Create career profile text
-                career_text = f"""
+    def _build_career_text(self, career: Dict) -> str:
+        """Create career profile text used for embedding and interest matching"""
+        return f"""
                 Career: {career['title']}
                 Skills: {career.get('top_skills', '')}
                 Day in Life: {career.get('day_in_life', '')}
                 Salary Range: ${career.get('salary_low', 0)} - ${career.get('salary_high', 0)}
                 Growth: {career.get('growth_pct', 0)}%
                 """
-                
-                # Generate career embedding
-                career_embedding = await self._generate_career_embedding(career_text)
-                
-                # Calculate similarity
-                similarity = self._calculate_embedding_similarity(user_embedding, career_embedding)
-                
+    
+    def _calculate_career_similarities(self, user_embedding: List[float], user_profile: Dict, career_matrix: np.ndarray) -> List[Dict]:
+        """Calculate similarities between user and all careers"""
+        similarities = []
+        
+        # Career rows are unit-length, so one matrix-vector product gives every cosine similarity
+        semantic_scores = career_matrix.astype(np.float32) @ _unit_rows(user_embedding)
+        
+        for i, similarity in enumerate(semantic_scores.tolist()):
+            career = self._career_record(i)
+            try:
                 # Add additional matching factors
-                skill_match = self._calculate_skill_match(user_profile['skills'], career.get('top_skills', ''))
-                interest_match = self._calculate_interest_match(user_profile['interests'], career_text)
+                skill_match = self._calculate_skill_match(user_profile['skills'], self._career_skill_text[i])
+                interest_match = self._calculate_interest_match(user_profile['interests'], self._career_texts_lower[i])
                 
                 # Weighted similarity score
                 weighted_similarity = (similarity * 0.5) + (skill_match * 0.3) + (interest_match * 0.2)
                 
                 similarities.append({
-                    "title": career["title"],
+                    **career,
                     "similarity": weighted_similarity,
                     "semantic_similarity": similarity,
                     "skill_match": skill_match,
                     "interest_match": interest_match,
-                    "salary_low": career.get("salary_low", 0),
-                    "salary_high": career.get("salary_high", 0),
-                    "growth_pct": career.get("growth_pct", 0),
-                    "top_skills": career.get("top_skills", ""),
-                    "day_in_life": career.get("day_in_life", ""),
-                    "matching_reasons": self._generate_matching_reasons(user_profile, career, weighted_similarity)
+                    "matching_reasons": self._generate_matching_reasons(user_profile, i, skill_match, interest_match, weighted_similarity)
                 })
                 
             except Exception as e:
@@ -371,148 +582,186 @@ class CareerMatcher:
         
         return similarities
     
-    async def _generate_career_embedding(self, career_text: str) -> List[float]:
-        """Generate embedding for career using Cohere with rate limiting"""
-        try:
-            # Add delay to prevent rate limiting
-            import asyncio
-            await asyncio.sleep(0.2)  # 200ms delay between requests
-            
-            url = "https://api.cohere.ai/v1/embed"
-            headers = {
-                "Authorization": f"Bearer {self.cohere_api_key}",
-                "Content-Type": "application/json"
-            }
-            payload = {
-                "model": "embed-english-light-v3.0",
-                "texts": [career_text],
-                "input_type": "search_document"
-            }
-            
-            async with httpx.AsyncClient() as client:
-                res = await client.post(url, headers=headers, json=payload)
-                res.raise_for_status()
-                embeddings = res.json()["embeddings"]
-                return embeddings[0] if embeddings else self._generate_fallback_embedding(career_text)
-            
-        except Exception as e:
-            logger.error(f"Failed to generate career embedding: {e}")
-            # Return fallback embedding immediately to avoid cascading failures
-            return self._generate_fallback_embedding(career_text)
+    def _get_http_client(self) -> httpx.AsyncClient:
+        # One long-lived client so embedding requests reuse pooled TLS connections
+        if self._http is None:
+            self._http = httpx.AsyncClient(
+                timeout=30.0,
+                limits=httpx.Limits(max_connections=32, max_keepalive_connections=16),
+                headers={
+                    "Authorization": f"Bearer {self.cohere_api_key}",
+                    "Content-Type": "application/json"
+                }
+            )
+        return self._http
     
-    def _calculate_embedding_similarity(self, embedding1: List[float], embedding2: List[float]) -> float:
-        """Calculate cosine similarity between embeddings"""
-        if not embedding1 or not embedding2:
-            return 0.0
+    def _get_groq_client(self) -> httpx.AsyncClient:
+        # Shared across Groq calls so the analysis generators reuse one TLS connection pool
+        if self._groq_http is None:
+            self._groq_http = httpx.AsyncClient(
+                timeout=30.0,
+                limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+                headers={
+                    "Authorization": f"Bearer {self.groq_api_key}",
+                    "Content-Type": "application/json"
+                }
+            )
+        return self._groq_http
+    
+    async def close(self):
+        """Close the pooled HTTP clients"""
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+        if self._groq_http is not None:
+            await self._groq_http.aclose()
+            self._groq_http = None
+    
+    async def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        """Embed up to COHERE_EMBED_BATCH texts in a single Cohere request"""
+        url = "https://api.cohere.ai/v1/embed"
+        # Serialized once with orjson and reused across retries
+        body = orjson.dumps({
+            "model": "embed-english-light-v3.0",
+            "texts": texts,
+            "input_type": "search_document"
+        })
         
-        min_length = min(len(embedding1), len(embedding2))
-        if min_length == 0:
-            return 0.0
+        backoff = 1.0
+        for attempt in range(COHERE_MAX_RETRIES + 1):
+            async with self._embed_semaphore:
+                res = await self._get_http_client().post(url, content=body)
+            # Back off only when Cohere actually rate-limits us, honouring Retry-After when given
+            if res.status_code == 429 and attempt < COHERE_MAX_RETRIES:
+                try:
+                    wait_s = min(float(res.headers.get("Retry-After", backoff)), 15.0)
+                except ValueError:
+                    wait_s = backoff
+                logger.warning(f"Cohere rate limited, retrying in {wait_s:.1f}s")
+                await asyncio.sleep(wait_s)
+                backoff *= 2
+                continue
+            res.raise_for_status()
+            return res.json()["embeddings"]
+    
+    async def _generate_career_embeddings(self, career_texts: List[str]) -> Tuple[List[List[float]], bool]:
+        """Generate embeddings for all careers using batched Cohere requests.
+        Returns the embeddings and whether every batch came from the API (no fallbacks)."""
+        batches = [career_texts[i:i + COHERE_EMBED_BATCH] for i in range(0, len(career_texts), COHERE_EMBED_BATCH)]
+        results = await asyncio.gather(*(self._embed_batch(batch) for batch in batches), return_exceptions=True)
         
-        dot_product = sum(embedding1[i] * embedding2[i] for i in range(min_length))
-        magnitude1 = sum(val ** 2 for val in embedding1[:min_length]) ** 0.5
-        magnitude2 = sum(val ** 2 for val in embedding2[:min_length]) ** 0.5
+        embeddings = []
+        complete = True
+        for batch, result in zip(batches, results):
+            if isinstance(result, Exception) or len(result) != len(batch):
+                logger.error(f"Failed to generate career embeddings for batch: {result if isinstance(result, Exception) else 'size mismatch'}")
+                # Fallback embeddings for this batch only to avoid cascading failures
+                embeddings.extend(self._generate_fallback_embedding(text) for text in batch)
+                complete = False
+            else:
+                embeddings.extend(result)
+        return embeddings, complete
+    
+    def _career_embeddings_path(self) -> Path:
+        return self.data_path / f"career_embeddings_{self._career_data_digest}.npy"
+    
+    async def _load_or_build_career_embeddings(self, career_texts: List[str]) -> np.ndarray:
+        """Return the career embedding matrix, loading it from disk or embedding every career once.
+        The file name carries the dataset hash, so editing the CSV invalidates the cache."""
+        if self._career_matrix is not None and len(self._career_matrix) == len(career_texts):
+            return self._career_matrix
         
-        if magnitude1 == 0 or magnitude2 == 0:
-            return 0.0
+        path = self._career_embeddings_path()
+        try:
+            if path.exists():
+                matrix = _unit_rows(np.load(path)).astype(CAREER_EMBEDDING_DTYPE)
+                if len(matrix) == len(career_texts):
+                    self._career_matrix = matrix
+                    logger.info(f"Loaded career embeddings from {path.name}")
+                    return matrix
+        except Exception as e:
+            logger.warning(f"Failed to load cached career embeddings: {e}")
         
-        return dot_product / (magnitude1 * magnitude2)
+        embeddings, complete = await self._generate_career_embeddings(career_texts)
+        matrix = _unit_rows(embeddings).astype(CAREER_EMBEDDING_DTYPE)
+        if complete:
+            # Only persist/keep real API embeddings; fallbacks are retried on the next request
+            self._career_matrix = matrix
+            try:
+                np.save(path, matrix)
+                logger.info(f"Saved {len(matrix)} career embeddings to {path.name}")
+            except Exception as e:
+                logger.warning(f"Failed to persist career embeddings: {e}")
+        return matrix
     
-    def _calculate_skill_match(self, user_skills: List[str], career_skills: str) -> float:
-        """Calculate skill match between user and career"""
-        if not user_skills or not career_skills:
+    def _calculate_skill_match(self, user_skills: List[str], career_skill_text: str) -> float:
+        """Calculate skill match between user and career (career skills pre-joined by _join_skills)"""
+        if not user_skills or not career_skill_text:
             return 0.0
         
-        career_skill_list = [skill.strip().lower() for skill in career_skills.split(',')]
-        user_skill_list = [skill.lower() for skill in user_skills]
-        
-        matches = sum(1 for skill in user_skill_list if any(skill in career_skill for career_skill in career_skill_list))
-        return matches / len(user_skill_list) if user_skill_list else 0.0
+        # A user skill matches when it is a substring of any one career skill; the separator never occurs in skills
+        matches = sum(1 for skill in user_skills if skill.lower() in career_skill_text)
+        return matches / len(user_skills)
     
-    def _calculate_interest_match(self, user_interests: List[str], career_text: str) -> float:
-        """Calculate interest match between user and career"""
+    def _calculate_interest_match(self, user_interests: List[str], career_lower: str) -> float:
+        """Calculate interest match between user and (lowercased) career text"""
         if not user_interests:
             return 0.0
         
-        career_lower = career_text.lower()
         matches = sum(1 for interest in user_interests if interest.lower() in career_lower)
-        return matches / len(user_interests) if user_interests else 0.0
+        return matches / len(user_interests)
     
-    def _generate_matching_reasons(self, user_profile: Dict, career: pd.Series, similarity: float) -> List[str]:
+    def _generate_matching_reasons(self, user_profile: Dict, career_idx: int, skill_match: float, interest_match: float, similarity: float) -> List[str]:
         """Generate reasons why this career matches the user"""
         reasons = []
+        career_text = self._career_texts_lower[career_idx]
         
         # Skill-based reasons
-        if user_profile['skills']:
-            skill_match = self._calculate_skill_match(user_profile['skills'], career.get('top_skills', ''))
-            if skill_match > 0.3:
-                reasons.append(f"Your skills align well with this role ({skill_match:.1%} match)")
+        if skill_match > 0.3:
+            reasons.append(f"Your skills align well with this role ({skill_match:.1%} match)")
         
         # Interest-based reasons
-        if user_profile['interests']:
-            interest_match = self._calculate_interest_match(user_profile['interests'], str(career))
-            if interest_match > 0.3:
-                reasons.append(f"Your interests match this career path ({interest_match:.1%} match)")
+        if interest_match > 0.3:
+            reasons.append(f"Your interests match this career path ({interest_match:.1%} match)")
         
         # Work preference reasons
         work_prefs = user_profile['work_preferences']
-        if work_prefs.get('team_size') == 'small' and 'collaboration' in str(career).lower():
+        if work_prefs.get('team_size') == 'small' and 'collaboration' in career_text:
             reasons.append("You prefer small teams and this role offers close collaboration")
         
         # Learning style reasons
-        if user_profile['learning_style'] == 'hands_on_practical' and 'hands-on' in str(career).lower():
+        if user_profile['learning_style'] == 'hands_on_practical' and 'hands-on' in career_text:
             reasons.append("Your hands-on learning style fits this practical role")
         
         # Career goal reasons
-        if 'leadership' in user_profile['career_goals'] and 'leadership' in str(career).lower():
+        if 'leadership' in user_profile['career_goals'] and 'leadership' in career_text:
             reasons.append("This role offers leadership opportunities aligned with your goals")
         
         return reasons if reasons else ["This role matches your overall profile and interests"]
     
+    def _quiz_to_topk(self, answers: List[int], k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Quiz answers -> RIASEC vector -> cosine against every career -> k best (indices, scores), best first.
+        Every step is a vectorized numpy call over the precomputed LUT and normalized career matrix."""
+        scores = self._riasec_matrix @ self.answers_to_vec(answers)
+        idx = _top_k_indices(scores, k)
+        return idx, scores[idx]
+    
     def _get_basic_career_matches(self, answers: List[int], top_k: int = 5) -> List[Dict]:
         """Fallback to basic RIASEC matching"""
-        # Convert answers to RIASEC vector
-        user_vec = self.answers_to_vec(answers)
-        
-        # Calculate similarity with career data
-        similarities = []
-        
-        for _, career in self.career_data.iterrows():
-            # Create career vector from RIASEC scores
-            career_vec = np.array([
-                career.get("realistic", 0),
-                career.get("investigative", 0),
-                career.get("artistic", 0),
-                career.get("social", 0),
-                career.get("enterprising", 0),
-                career.get("conventional", 0)
-            ])
-            
-            # Normalize career vector
-            norm = np.linalg.norm(career_vec)
-            if norm > 0:
-                career_vec = career_vec / norm
-            
-            # Calculate cosine similarity
-            similarity = np.dot(user_vec, career_vec)
-            similarities.append({
-                "title": career["title"],
-                "similarity": similarity,
-                "salary_low": career.get("salary_low", 0),
-                "salary_high": career.get("salary_high", 0),
-                "growth_pct": career.get("growth_pct", 0),
-                "top_skills": career.get("top_skills", ""),
-                "day_in_life": career.get("day_in_life", "")
-            })
-        
-        # Sort by similarity and return top matches
-        similarities.sort(key=lambda x: x["similarity"], reverse=True)
+        # Only the best candidates are materialized; the diversity filter draws from this pool
+        pool_idx, pool_scores = self._quiz_to_topk(answers, top_k * DIVERSITY_POOL_FACTOR)
+        similarities = [
+            {**self._career_record(i), "similarity": score}
+            for i, score in zip(pool_idx.tolist(), pool_scores.tolist())
+        ]
         
         # Ensure diversity in results by filtering out very similar careers
         diverse_results = []
         seen_titles = set()
         
         for match in similarities:
+            if len(diverse_results) >= top_k:
+                break
             title = match["title"].lower()
             # Check if this career is too similar to already selected ones
             is_similar = any(
@@ -533,37 +782,26 @@ class CareerMatcher:
         
         return diverse_results
     
-    def _generate_fallback_embedding(self, text: str) -> List[float]:
+    def _generate_fallback_embedding(self, text: str) -> np.ndarray:
         """Generate fallback embedding based on text characteristics"""
-        embedding = [0.0] * 384  # Cohere embedding size
+        embedding = np.empty(FALLBACK_EMBEDDING_DIM, dtype=np.float32)
         
         # Basic text analysis
         words = text.lower().split()
-        char_count = len(text)
         word_count = len(words)
         
-        # Technical indicators
-        technical_terms = ['api', 'database', 'algorithm', 'function', 'class', 'method', 'variable', 'loop', 'condition', 'error']
-        framework_terms = ['react', 'python', 'javascript', 'docker', 'kubernetes', 'aws', 'azure', 'node', 'express', 'fastapi']
-        learning_terms = ['learn', 'understand', 'practice', 'example', 'tutorial', 'guide', 'step', 'process', 'method']
-        
-        # Calculate technical density
-        technical_score = sum(1 for word in words if word in technical_terms) / max(word_count, 1)
-        framework_score = sum(1 for word in words if word in framework_terms) / max(word_count, 1)
-        learning_score = sum(1 for word in words if word in learning_terms) / max(word_count, 1)
-        
-        # Set embedding values based on characteristics
-        embedding[0] = min(technical_score, 1.0)
-        embedding[1] = min(framework_score, 1.0)
-        embedding[2] = min(learning_score, 1.0)
-        embedding[3] = min(char_count / 1000, 1.0)
-        embedding[4] = min(word_count / 100, 1.0)
-        
-        # Add some randomness for uniqueness
-        import random
-        random.seed(hash(text) % 10000)
-        for i in range(5, 384):
-            embedding[i] = random.uniform(-0.1, 0.1)
+        # Technical / framework / learning term densities from one dict lookup per word
+        slots = [slot for word in words for slot in _FALLBACK_TERM_SLOTS.get(word, ())]
+        term_counts = np.bincount(slots, minlength=3)[:3]
+        embedding[:3] = term_counts / max(word_count, 1)
+        embedding[3] = len(text) / 1000
+        embedding[4] = word_count / 100
+        np.minimum(embedding[:5], 1.0, out=embedding[:5])
+        
+        # Add some randomness for uniqueness; a 64-bit content hash keeps it stable across processes
+        seed = int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little")
+        rng = np.random.default_rng(seed)
+        embedding[5:] = rng.uniform(-0.1, 0.1, FALLBACK_EMBEDDING_DIM - 5)
         
         return embedding
 
@@ -577,8 +815,9 @@ class CareerMatcher:
         best_match = None
         best_similarity = 0
         
-        for title in self.career_roadmaps.keys():
-            similarity = self._calculate_title_similarity(career_title, title)
+        query_mask, unknown_words = self._title_mask(career_title)
+        for title, title_mask in self._roadmap_title_index[1].items():
+            similarity = self._calculate_title_similarity(query_mask, unknown_words, title_mask)
             if similarity > best_similarity:
                 best_similarity = similarity
                 best_match = title
@@ -589,18 +828,41 @@ class CareerMatcher:
         # Return a generic roadmap if no good match found
         return self._create_generic_roadmap(career_title)
 
-    def _calculate_title_similarity(self, title1: str, title2: str) -> float:
-        """Calculate similarity between two career titles"""
-        words1 = set(title1.lower().split())
-        words2 = set(title2.lower().split())
-        
-        if not words1 or not words2:
+    @staticmethod
+    def _build_title_masks(roadmaps: Dict) -> Tuple[Dict[str, int], Dict[str, int]]:
+        """Word vocabulary over roadmap titles plus one bitmask per title (bit i set = vocab word i present)"""
+        vocab: Dict[str, int] = {}
+        masks: Dict[str, int] = {}
+        for title in roadmaps:
+            mask = 0
+            for word in set(title.lower().split()):
+                mask |= 1 << vocab.setdefault(word, len(vocab))
+            masks[title] = mask
+        return vocab, masks
+
+    def _title_mask(self, title: str) -> Tuple[int, int]:
+        """Bitmask of a title's known words and the count of words outside the roadmap vocabulary"""
+        vocab = self._roadmap_title_index[0]
+        mask = 0
+        unknown_words = 0
+        for word in set(title.lower().split()):
+            bit = vocab.get(word)
+            if bit is None:
+                unknown_words += 1
+            else:
+                mask |= 1 << bit
+        return mask, unknown_words
+
+    def _calculate_title_similarity(self, query_mask: int, unknown_words: int, title_mask: int) -> float:
+        """Jaccard similarity between two career titles from their word bitmasks"""
+        if not (query_mask or unknown_words) or not title_mask:
             return 0.0
         
-        intersection = words1.intersection(words2)
-        union = words1.union(words2)
+        # Unknown query words can only appear in the union
+        intersection = (query_mask & title_mask).bit_count()
+        union = (query_mask | title_mask).bit_count() + unknown_words
         
-        return len(intersection) / len(union)
+        return intersection / union
 
     def _create_generic_roadmap(self, career_title: str) -> Dict:
         """Create a generic roadmap for any career"""
@@ -650,10 +912,9 @@ class CareerMatcher:
             Return as JSON format.
             """
             
-            response = await self._call_groq(prompt)
-            return json.loads(response)
+            return await self._generate_json(prompt)
             
-        except Exception as e:
+        except (httpx.HTTPError, ValueError, KeyError) as e:
             logger.error(f"Error generating AI roadmap: {e}")
             return self._create_generic_roadmap(career_title)
     
@@ -673,10 +934,9 @@ class CareerMatcher:
             Return as JSON format.
             """
             
-            response = await self._call_groq(prompt)
-            return json.loads(response)
+            return await self._generate_json(prompt)
             
-        except Exception as e:
+        except (httpx.HTTPError, ValueError, KeyError) as e:
             logger.error(f"Error generating interview prep: {e}")
             return self._get_fallback_interview_prep(career_title)
     
@@ -694,10 +954,9 @@ class CareerMatcher:
             Return as JSON format.
             """
             
-            response = await self._call_groq(prompt)
-            return json.loads(response)
+            return await self._generate_json(prompt)
             
-        except Exception as e:
+        except (httpx.HTTPError, ValueError, KeyError) as e:
             logger.error(f"Error generating market insights: {e}")
             return self._get_fallback_market_insights(career_title)
     
@@ -719,19 +978,75 @@ class CareerMatcher:
             Return as JSON format.
             """
             
-            response = await self._call_groq(prompt)
-            return json.loads(response)
+            return await self._generate_json(prompt)
             
-        except Exception as e:
+        except (httpx.HTTPError, ValueError, KeyError) as e:
             logger.error(f"Error generating learning plan: {e}")
             return self._get_fallback_learning_plan()
     
+    async def _generate_all_sections(self, career_title: str, user_skills: Optional[List[str]] = None) -> Dict:
+        """Generate roadmap, interview prep, market insights and learning plan in a single Groq call"""
+        prompt = f"""
+        Create a career analysis for {career_title}.
+        
+        User's current skills: {user_skills or []}
+        
+        Return a single JSON object with exactly these keys:
+        - "ai_roadmap": entry, mid and senior levels, each with title, required skills, recommended courses, duration and salary range
+        - "interview_preparation": common interview questions, technical assessment tips, behavioral questions, portfolio recommendations, salary negotiation tips
+        - "market_insights": current demand, salary trends, required skills, industry outlook, growth opportunities
+        - "learning_plan": skill gaps analysis, learning priorities, recommended courses, timeline, milestones
+        """
+        
+        return await self._generate_json(prompt, validate=self._check_all_sections)
+    
+    @staticmethod
+    def _check_all_sections(sections: Dict):
+        missing = [key for key in ANALYSIS_SECTIONS if not isinstance(sections.get(key), dict)]
+        if missing:
+            raise ValueError(f"Combined analysis is missing sections: {missing}")
+    
+    async def _generate_sections_separately(self, top_career: str, user_skills: Optional[List[str]]) -> Tuple[Dict, Dict, Dict, Dict]:
+        """Per-section generation, used when the combined prompt doesn't come back usable"""
+        # The four Groq calls are independent
+        ai_roadmap, interview_prep, market_insights, learning_plan = await asyncio.gather(
+            self.generate_ai_roadmap(top_career, user_skills),
+            self.generate_interview_preparation(top_career),
+            self.generate_market_insights(top_career),
+            self.generate_learning_plan(top_career, user_skills),
+            return_exceptions=True
+        )
+        
+        # One failed section should not sink the whole analysis
+        if isinstance(ai_roadmap, Exception):
+            logger.error(f"Error generating AI roadmap: {ai_roadmap}")
+            ai_roadmap = self._create_generic_roadmap(top_career)
+        if isinstance(interview_prep, Exception):
+            logger.error(f"Error generating interview prep: {interview_prep}")
+            interview_prep = self._get_fallback_interview_prep(top_career)
+        if isinstance(market_insights, Exception):
+            logger.error(f"Error generating market insights: {market_insights}")
+            market_insights = self._get_fallback_market_insights(top_career)
+        if isinstance(learning_plan, Exception):
+            logger.error(f"Error generating learning plan: {learning_plan}")
+            learning_plan = self._get_fallback_learning_plan()
+        
+        return ai_roadmap, interview_prep, market_insights, learning_plan
+    
     async def generate_comprehensive_career_analysis(
         self, 
         answers: List[int], 
         user_skills: Optional[List[str]] = None
     ) -> Dict:
         """Generate comprehensive career analysis from quiz answers"""
+        cache_key = hashlib.blake2b(orjson.dumps([list(answers), sorted(user_skills or [])]), digest_size=16).digest()
+        cached = self._analysis_cache.get(cache_key)
+        if cached is not None:
+            if time.monotonic() - cached[0] <= ANALYSIS_CACHE_TTL_SECONDS:
+                self._analysis_cache.move_to_end(cache_key)
+                return cached[1]
+            del self._analysis_cache[cache_key]
+        
         try:
             # Get career matches using embedding-based matching
             career_matches = await self.get_career_matches(answers, user_skills=user_skills, top_k=3)
@@ -741,112 +1056,233 @@ class CareerMatcher:
             
             top_career = career_matches[0]["title"]
             
-            # Generate AI-powered content for top career
-            ai_roadmap = await self.generate_ai_roadmap(top_career, user_skills)
-            interview_prep = await self.generate_interview_preparation(top_career)
-            market_insights = await self.generate_market_insights(top_career)
-            learning_plan = await self.generate_learning_plan(top_career, user_skills)
+            # One Groq round trip for all four sections; per-section calls only if that fails
+            try:
+                sections = await self._generate_all_sections(top_career, user_skills)
+                ai_roadmap, interview_prep, market_insights, learning_plan = (sections[key] for key in ANALYSIS_SECTIONS)
+                cacheable = True
+            except ValueError as e:
+                logger.warning(f"Combined analysis generation failed, generating sections separately: {e}")
+                ai_roadmap, interview_prep, market_insights, learning_plan = await self._generate_sections_separately(top_career, user_skills)
+                # Sections may be static fallbacks here; don't pin those for a day
+                cacheable = False
             
-            return {
+            analysis = {
                 "career_matches": career_matches,
                 "top_career": top_career,
                 "ai_roadmap": ai_roadmap,
                 "interview_preparation": interview_prep,
                 "market_insights": market_insights,
                 "learning_plan": learning_plan,
-                "analysis_timestamp": str(pd.Timestamp.now())
+                "analysis_timestamp": datetime.now(timezone.utc).isoformat()
             }
+            if cacheable:
+                self._analysis_cache[cache_key] = (time.monotonic(), analysis)
+                while len(self._analysis_cache) > ANALYSIS_CACHE_CAPACITY:
+                    self._analysis_cache.popitem(last=False)
+            return analysis
             
         except Exception as e:
-            logger.error(f"Error generating comprehensive analysis: {e}")
+            logger.exception(f"Error generating comprehensive analysis: {e}")
             return {"error": f"Analysis failed: {str(e)}"}
     
+    async def _generate_json(self, prompt: str, validate: Optional[Callable[[Dict], None]] = None) -> Dict:
+        """Call Groq and parse its answer as a JSON object; raises ValueError when nothing usable came back.
+        `validate` may raise ValueError to reject a parsed answer; rejected answers are never cached.
+        Results are cached by model + prompt (the prompt already carries the generator, career title and
+        user skills): in memory, and on disk so restarts don't pay for the same generations again."""
+        prompt = _compact_prompt(prompt)
+        cache_key = hashlib.blake2b(f"{GROQ_MODEL}\n{prompt}".encode("utf-8"), digest_size=16).digest()
+        cached = self._generation_cache.get(cache_key)
+        if cached is not None:
+            if time.monotonic() - cached[0] <= GENERATION_DISK_CACHE_TTL_SECONDS:
+                self._generation_cache.move_to_end(cache_key)
+                return cached[1]
+            del self._generation_cache[cache_key]
+        
+        path = self._generation_cache_path(cache_key)
+        parsed = await asyncio.to_thread(self._read_generation, path)
+        if parsed is not None and validate is not None:
+            try:
+                validate(parsed)
+            except ValueError:
+                # Written before validation existed; regenerate instead of trusting it
+                parsed = None
+        if parsed is None:
+            response = await self._call_groq(prompt)
+            parsed = _parse_llm_json(response)
+            if parsed is None:
+                raise ValueError(f"Unparseable Groq response: {response[:200]!r}")
+            if validate is not None:
+                validate(parsed)
+            await asyncio.to_thread(self._write_generation, path, parsed)
+        
+        self._generation_cache[cache_key] = (time.monotonic(), parsed)
+        while len(self._generation_cache) > GENERATION_CACHE_CAPACITY:
+            self._generation_cache.popitem(last=False)
+        return parsed
+    
+    def _generation_cache_path(self, cache_key: bytes) -> Path:
+        return self.data_path / "generation_cache" / f"{cache_key.hex()}.json"
+    
+    @staticmethod
+    def _read_generation(path: Path) -> Optional[Dict]:
+        try:
+            if time.time() - path.stat().st_mtime > GENERATION_DISK_CACHE_TTL_SECONDS:
+                path.unlink(missing_ok=True)
+                return None
+            return orjson.loads(path.read_bytes())
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"Failed to read cached generation {path.name}: {e}")
+            return None
+    
+    @staticmethod
+    def _write_generation(path: Path, parsed: Dict):
+        try:
+            path.parent.mkdir(exist_ok=True)
+            # Write-then-rename so concurrent workers never read a half-written file
+            tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+            tmp_path.write_bytes(orjson.dumps(parsed))
+            os.replace(tmp_path, path)
+            CareerMatcher._prune_generation_cache(path.parent)
+        except Exception as e:
+            logger.warning(f"Failed to persist generation {path.name}: {e}")
+    
+    @staticmethod
+    def _prune_generation_cache(cache_dir: Path):
+        """Drop expired entries, then the oldest ones beyond GENERATION_DISK_CACHE_MAX_FILES"""
+        entries = []
+        for entry in os.scandir(cache_dir):
+            if entry.name.endswith(".json"):
+                try:
+                    entries.append((entry.stat().st_mtime, entry.path))
+                except FileNotFoundError:
+                    continue
+        cutoff = time.time() - GENERATION_DISK_CACHE_TTL_SECONDS
+        entries.sort()
+        excess = len(entries) - GENERATION_DISK_CACHE_MAX_FILES
+        for i, (mtime, entry_path) in enumerate(entries):
+            if i >= excess and mtime >= cutoff:
+                break
+            Path(entry_path).unlink(missing_ok=True)
+    
     async def _call_groq(self, prompt: str) -> str:
         """Call Groq API for AI generation"""
         try:
-            url = "https://api.groq.com/openai/v1/chat/completions"
-            headers = {
-                "Authorization": f"Bearer {self.groq_api_key}",
-                "Content-Type": "application/json"
-            }
-            payload = {
-                "model": "llama3-8b-8192",
+            body = orjson.dumps({
+                "model": GROQ_MODEL,
                 "messages": [{"role": "user", "content": prompt}],
                 "temperature": 0.7,
-                "stream": False
-            }
+                "stream": True
+            })
             
-            async with httpx.AsyncClient() as client:
-                res = await client.post(url, headers=headers, json=payload)
-                res.raise_for_status()
-                return res.json()["choices"][0]["message"]["content"]
-        except Exception as e:
+            backoff = 1.0
+            for attempt in range(GROQ_MAX_RETRIES + 1):
+                async with self._groq_limiter:
+                    async with self._get_groq_client().stream("POST", GROQ_CHAT_URL, content=body) as res:
+                        if res.status_code != 429 or attempt == GROQ_MAX_RETRIES:
+                            res.raise_for_status()
+                            return await self._read_groq_stream(res)
+                        try:
+                            wait_s = min(float(res.headers.get("Retry-After", backoff)), 15.0)
+                        except ValueError:
+                            wait_s = backoff
+                logger.warning(f"Groq rate limited, retrying in {wait_s:.1f}s")
+                await asyncio.sleep(wait_s)
+                backoff *= 2
+        except (httpx.HTTPError, ValueError, KeyError, IndexError) as e:
             logger.error(f"Groq API call failed: {e}")
             return "AI service temporarily unavailable"
     
+    @staticmethod
+    async def _read_groq_stream(res: httpx.Response) -> str:
+        """Collect the content deltas of an OpenAI-style SSE completion stream"""
+        parts = []
+        async for line in res.aiter_lines():
+            if not line.startswith("data:"):
+                continue
+            data = line[5:].strip()
+            if data == "[DONE]":
+                break
+            choices = orjson.loads(data).get("choices") or ({},)
+            content = choices[0].get("delta", {}).get("content")
+            if content:
+                parts.append(content)
+        return "".join(parts)
+    
     # Fallback methods
     def _get_fallback_interview_prep(self, career_title: str) -> Dict:
         """Fallback interview preparation"""
-        return {
-            "common_questions": [
-                "Tell me about yourself",
-                "Why do you want this position?",
-                "What are your strengths and weaknesses?",
-                "Where do you see yourself in 5 years?"
-            ],
-            "technical_tips": [
-                "Practice coding problems",
-                "Review fundamental concepts",
-                "Prepare for system design questions"
-            ],
-            "behavioral_questions": [
-                "Describe a challenging project",
-                "How do you handle conflicts?",
-                "Tell me about a time you failed"
-            ],
-            "portfolio_tips": [
-                "Showcase relevant projects",
-                "Include code samples",
-                "Demonstrate problem-solving skills"
-            ],
-            "salary_negotiation": [
-                "Research market rates",
-                "Highlight your value",
-                "Be prepared to negotiate"
-            ]
-        }
+        return dict(_FALLBACK_INTERVIEW_PREP)
     
     def _get_fallback_market_insights(self, career_title: str) -> Dict:
         """Fallback market insights"""
-        return {
-            "current_demand": "High demand for tech roles",
-            "salary_trends": "Salaries continue to rise",
-            "required_skills": ["Technical skills", "Communication", "Problem solving"],
-            "industry_outlook": "Positive growth expected",
-            "growth_opportunities": "Many advancement opportunities available"
-        }
+        return dict(_FALLBACK_MARKET_INSIGHTS)
     
     def _get_fallback_learning_plan(self) -> Dict:
         """Fallback learning plan"""
-        return {
-            "skill_gaps": ["Technical skills", "Industry knowledge"],
-            "learning_priorities": [
-                "Master core technologies",
-                "Build practical projects",
-                "Network with professionals"
-            ],
-            "recommended_courses": [
-                "Fundamentals course",
-                "Advanced specialization",
-                "Industry certification"
-            ],
-            "timeline": "6-12 months",
-            "milestones": [
-                "Complete fundamentals",
-                "Build portfolio",
-                "Apply for positions"
-            ]
-        }
+        return dict(_FALLBACK_LEARNING_PLAN)
+
+# Static fallback payloads, built once; inner sequences are tuples so the shallow copies
+# handed out above can't leak mutations back into these
+_FALLBACK_INTERVIEW_PREP = {
+    "common_questions": (
+        "Tell me about yourself",
+        "Why do you want this position?",
+        "What are your strengths and weaknesses?",
+        "Where do you see yourself in 5 years?"
+    ),
+    "technical_tips": (
+        "Practice coding problems",
+        "Review fundamental concepts",
+        "Prepare for system design questions"
+    ),
+    "behavioral_questions": (
+        "Describe a challenging project",
+        "How do you handle conflicts?",
+        "Tell me about a time you failed"
+    ),
+    "portfolio_tips": (
+        "Showcase relevant projects",
+        "Include code samples",
+        "Demonstrate problem-solving skills"
+    ),
+    "salary_negotiation": (
+        "Research market rates",
+        "Highlight your value",
+        "Be prepared to negotiate"
+    )
+}
+
+_FALLBACK_MARKET_INSIGHTS = {
+    "current_demand": "High demand for tech roles",
+    "salary_trends": "Salaries continue to rise",
+    "required_skills": ("Technical skills", "Communication", "Problem solving"),
+    "industry_outlook": "Positive growth expected",
+    "growth_opportunities": "Many advancement opportunities available"
+}
+
+_FALLBACK_LEARNING_PLAN = {
+    "skill_gaps": ("Technical skills", "Industry knowledge"),
+    "learning_priorities": (
+        "Master core technologies",
+        "Build practical projects",
+        "Network with professionals"
+    ),
+    "recommended_courses": (
+        "Fundamentals course",
+        "Advanced specialization",
+        "Industry certification"
+    ),
+    "timeline": "6-12 months",
+    "milestones": (
+        "Complete fundamentals",
+        "Build portfolio",
+        "Apply for positions"
+    )
+}
 
 # Global instance for easy access
 matcher = CareerMatcher()
\ No newline at end of file
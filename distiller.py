@@ -1,6 +1,6 @@
-from typing import List, Dict, Optional, Tuple
+from typing import List, Dict, Optional, Tuple, Union
 from pathlib import Path
-import io, os, json, asyncio
+import io, os, re, json, asyncio, heapq, hashlib
 import fitz  # PyMuPDF
 from loguru import logger
 import httpx
@@ -8,7 +8,7 @@ from schemas import ExplanationLevel, Framework
 import uuid
 from datetime import datetime
 from dotenv import load_dotenv
-from collections import OrderedDict
+from collections import OrderedDict, deque
 
 # Load environment variables
 load_dotenv()
@@ -16,11 +16,28 @@ load_dotenv()
 CHUNK_WORDS = 400
 OVERLAP = 50
 
+# Summaries are "•"-delimited; splitting on the separator plus its surrounding whitespace
+# yields already-stripped bullets in a single pass
+_BULLET_RE = re.compile(r"\s*•\s*")
+
+def split_bullets(summary: str) -> List[str]:
+    """Split a "•"-delimited summary into non-empty, stripped bullets."""
+    return [p for p in _BULLET_RE.split(summary.strip()) if p]
+
 # In-memory conversation storage (replace with database in production)
-conversation_store: Dict[str, Dict] = {}
+# Bounded LRU: conversations carry full text + chunk embeddings, so cap how many a worker keeps
+conversation_store: "OrderedDict[str, Dict]" = OrderedDict()
+CONVERSATION_STORE_CAPACITY = 200
 # Track the most recent conversation per user to avoid losing context when FE forgets to pass conversation_id
 last_conversation_by_user: Dict[str, str] = {}
 
+def _conversation_store_evict_if_needed():
+    while len(conversation_store) > CONVERSATION_STORE_CAPACITY:
+        evicted_id, evicted = conversation_store.popitem(last=False)
+        uid = evicted.get("user_id")
+        if last_conversation_by_user.get(uid) == evicted_id:
+            last_conversation_by_user.pop(uid, None)
+
 # In-memory lesson cache with TTL and capacity (LRU)
 # Structure: { lesson_id: { 'summary': str, 'bullets': List[str], 'flashcards': List[Dict], 'quiz': List[Dict], 'concept_map': Dict, 'full_text': str, 'title': str, 'framework': str, 'cached_at': iso } }
 lesson_store: "OrderedDict[str, Dict]" = OrderedDict()
@@ -66,12 +83,22 @@ def get_lesson_cache(lesson_id: str) -> Optional[Dict]:
 # Deduplication map for content hashes
 content_hash_to_lesson_id: Dict[str, int] = {}
 
+def cancel_pending(tasks: List[asyncio.Task]):
+    """Cancel unfinished tasks and mark finished ones' exceptions as retrieved"""
+    for task in tasks:
+        if not task.done():
+            task.cancel()
+        elif not task.cancelled():
+            task.exception()
+
 def _hash_text(text: str) -> str:
     import hashlib
     h = hashlib.sha256()
     h.update(text.encode("utf-8", errors="ignore"))
     return h.hexdigest()
 
+RECENT_PDFS_LIMIT = 5
+
 # Enhanced conversation metadata for better UX
 conversation_metadata = {
     "recent_pdfs": {},  # Store recent PDFs per user
@@ -80,23 +107,44 @@ conversation_metadata = {
     "explanation_levels": {}  # Store user's explanation level preference
 }
 
+# Cohere's embed endpoint accepts at most 96 texts per request
+COHERE_EMBED_BATCH = 96
+_EMBED_SEMAPHORE = asyncio.Semaphore(4)
+_cohere_client: Optional[httpx.AsyncClient] = None
+
+def _get_cohere_client() -> httpx.AsyncClient:
+    # One pooled client per process so batches reuse the TLS connection
+    global _cohere_client
+    if _cohere_client is None:
+        _cohere_client = httpx.AsyncClient(
+            timeout=30.0,
+            headers={
+                "Authorization": f"Bearer {os.getenv('COHERE_API_KEY')}",
+                "Content-Type": "application/json"
+            }
+        )
+    return _cohere_client
+
+async def close_cohere_client():
+    """Close the pooled Cohere client"""
+    global _cohere_client
+    if _cohere_client is not None:
+        await _cohere_client.aclose()
+        _cohere_client = None
+
 async def cohere_embed(batch: List[str]) -> List[List[float]]:
     """Generate embeddings using Cohere API"""
     url = "https://api.cohere.ai/v1/embed"
-    headers = {
-        "Authorization": f"Bearer {os.getenv('COHERE_API_KEY')}",
-        "Content-Type": "application/json"
-    }
     payload = {
         "model": "embed-english-light-v3.0",
         "texts": batch,
         "input_type": "search_document"
     }
 
-    async with httpx.AsyncClient() as client:
-        res = await client.post(url, headers=headers, json=payload)
-        res.raise_for_status()
-        return res.json()["embeddings"]
+    async with _EMBED_SEMAPHORE:
+        res = await _get_cohere_client().post(url, json=payload)
+    res.raise_for_status()
+    return res.json()["embeddings"]
 
 def _parse_json_safely(raw: str) -> Optional[Dict]:
     """Best-effort extraction and parsing of JSON from LLM responses.
@@ -203,10 +251,15 @@ async def call_groq(messages: List[Dict]) -> str:
                     continue
                 return ""
 
-def pdf_to_text(path: Path) -> str:
+def pdf_to_text(source: Union[Path, bytes]) -> str:
+    """Extract text from a PDF given its path, or its raw bytes for small in-memory uploads."""
     try:
-        doc = fitz.open(str(path))
-        text = "\n\n".join(page.get_text() for page in doc)
+        if isinstance(source, (bytes, bytearray)):
+            doc = fitz.open(stream=source, filetype="pdf")
+        else:
+            doc = fitz.open(str(source))
+        with doc:
+            text = "\n\n".join(page.get_text() for page in doc)
         
         # Check if we got meaningful text
         if not text or len(text.strip()) < 10:
@@ -232,21 +285,56 @@ def chunk_text(text: str) -> List[str]:
         chunks.append(" ".join(cur))
     return chunks
 
+# Cross-request chunk embedding cache (LRU), keyed by a digest of the chunk text.
+# Re-uploads and shared boilerplate (cover pages, headers) skip the Cohere round-trip.
+_chunk_embed_cache: "OrderedDict[bytes, List[float]]" = OrderedDict()
+CHUNK_EMBED_CACHE_CAPACITY = 4096
+
+def _chunk_key(chunk: str) -> bytes:
+    return hashlib.blake2b(chunk.encode("utf-8", errors="ignore"), digest_size=16).digest()
+
 async def embed_chunks(chunks: List[str]) -> List[List[float]]:
     """
     Generate embeddings for text chunks using Cohere API.
     Creates semantic vector representations for similarity search and content understanding.
     """
-    try:
-        # Use Cohere API for embeddings
-        embeddings = await cohere_embed(chunks)
-        logger.info(f"Successfully generated {len(embeddings)} embeddings using Cohere")
-        return embeddings
-        
-    except Exception as e:
-        logger.error(f"Cohere embedding generation failed: {e}")
-        # Return fallback embeddings
-        return [_generate_fallback_embedding(chunk) for chunk in chunks]
+    keys = [_chunk_key(chunk) for chunk in chunks]
+    embeddings: List[Optional[List[float]]] = [None] * len(chunks)
+    missing: Dict[bytes, str] = {}
+    for i, key in enumerate(keys):
+        cached = _chunk_embed_cache.get(key)
+        if cached is not None:
+            _chunk_embed_cache.move_to_end(key)
+            embeddings[i] = cached
+        else:
+            missing.setdefault(key, chunks[i])
+
+    if missing:
+        miss_keys = list(missing)
+        miss_texts = list(missing.values())
+        try:
+            # Use Cohere API for embeddings; split into API-sized batches sent concurrently
+            batches = [miss_texts[i:i + COHERE_EMBED_BATCH] for i in range(0, len(miss_texts), COHERE_EMBED_BATCH)]
+            results = await asyncio.gather(*(cohere_embed(batch) for batch in batches))
+            vectors = [vec for batch_embeds in results for vec in batch_embeds]
+            if len(vectors) != len(miss_texts):
+                # zip() would silently drop the tail and leave chunks without an embedding
+                raise ValueError(f"Cohere returned {len(vectors)} embeddings for {len(miss_texts)} texts")
+            fresh = dict(zip(miss_keys, vectors))
+            for key, vec in fresh.items():
+                _chunk_embed_cache[key] = vec
+            while len(_chunk_embed_cache) > CHUNK_EMBED_CACHE_CAPACITY:
+                _chunk_embed_cache.popitem(last=False)
+            logger.info(f"Successfully generated {len(fresh)} embeddings using Cohere ({len(chunks) - len(fresh)} cached)")
+        except Exception as e:
+            logger.error(f"Cohere embedding generation failed: {e}")
+            # Fallback embeddings are never cached
+            fresh = {key: _generate_fallback_embedding(text) for key, text in missing.items()}
+        for i, key in enumerate(keys):
+            if embeddings[i] is None:
+                embeddings[i] = fresh[key]
+
+    return embeddings
 
 def _generate_fallback_embedding(text: str) -> List[float]:
     """
@@ -334,15 +422,13 @@ def find_similar_content(query_embedding: List[float], content_embeddings: List[
     Find the most similar content based on embedding similarity.
     Returns list of (index, similarity_score) tuples sorted by similarity.
     """
-    similarities = []
-    
-    for i, content_embedding in enumerate(content_embeddings):
-        similarity = calculate_embedding_similarity(query_embedding, content_embedding)
-        similarities.append((i, similarity))
+    similarities = [
+        (i, calculate_embedding_similarity(query_embedding, content_embedding))
+        for i, content_embedding in enumerate(content_embeddings)
+    ]
     
-    # Sort by similarity (descending) and return top_k results
-    similarities.sort(key=lambda x: x[1], reverse=True)
-    return similarities[:top_k]
+    # Partial selection of the top_k results (descending) instead of a full sort
+    return heapq.nlargest(top_k, similarities, key=lambda x: x[1])
 
 # Micro-lesson semantic index
 _MICRO_LESSONS_RAW: List[Dict] = []
@@ -802,20 +888,23 @@ def _get_fallback_concept_map(summary: str) -> Dict:
 def get_or_create_conversation(conversation_id: Optional[str], user_id: str) -> str:
     """Get existing conversation or create new one with enhanced metadata."""
     if conversation_id and conversation_id in conversation_store:
+        conversation_store.move_to_end(conversation_id)
         last_conversation_by_user[user_id] = conversation_id
         return conversation_id
     # If FE didn't pass conversation_id, try to reuse the last conversation for this user
     existing = last_conversation_by_user.get(user_id)
     if existing and existing in conversation_store:
+        conversation_store.move_to_end(existing)
         return existing
     
     new_conversation_id = str(uuid.uuid4())
+    now = datetime.utcnow().isoformat()
     conversation_store[new_conversation_id] = {
         "user_id": user_id,
         "messages": [],
         "file_context": None,
-        "created_at": datetime.utcnow().isoformat(),
-        "updated_at": datetime.utcnow().isoformat(),
+        "created_at": now,
+        "updated_at": now,
         "metadata": {
             "recent_pdfs": [],
             "framework_preferences": [],
@@ -825,14 +914,12 @@ def get_or_create_conversation(conversation_id: Optional[str], user_id: str) ->
         }
     }
     last_conversation_by_user[user_id] = new_conversation_id
+    _conversation_store_evict_if_needed()
     return new_conversation_id
 
 def update_user_preferences(user_id: str, preferences: Dict):
     """Update user preferences for personalized experience."""
-    if user_id not in conversation_metadata["user_preferences"]:
-        conversation_metadata["user_preferences"][user_id] = {}
-    
-    conversation_metadata["user_preferences"][user_id].update(preferences)
+    conversation_metadata["user_preferences"].setdefault(user_id, {}).update(preferences)
 
 def get_user_preferences(user_id: str) -> Dict:
     """Get user preferences for personalized experience."""
@@ -840,40 +927,36 @@ def get_user_preferences(user_id: str) -> Dict:
 
 def store_recent_pdf(user_id: str, pdf_name: str, framework: str, summary: str):
     """Store recent PDF information for quick access."""
-    if user_id not in conversation_metadata["recent_pdfs"]:
-        conversation_metadata["recent_pdfs"][user_id] = []
+    recent_pdfs = conversation_metadata["recent_pdfs"].get(user_id)
+    if recent_pdfs is None:
+        # Keep only last 5 PDFs (older entries are evicted on append)
+        recent_pdfs = conversation_metadata["recent_pdfs"][user_id] = deque(maxlen=RECENT_PDFS_LIMIT)
     
-    pdf_info = {
+    recent_pdfs.append({
         "name": pdf_name,
         "framework": framework,
         "summary": summary,
         "uploaded_at": datetime.utcnow().isoformat()
-    }
-    
-    # Keep only last 5 PDFs
-    recent_pdfs = conversation_metadata["recent_pdfs"][user_id]
-    recent_pdfs.append(pdf_info)
-    if len(recent_pdfs) > 5:
-        recent_pdfs.pop(0)
-    
-    conversation_metadata["recent_pdfs"][user_id] = recent_pdfs
+    })
 
 def get_recent_pdfs(user_id: str) -> List[Dict]:
     """Get recent PDFs for user."""
-    return conversation_metadata["recent_pdfs"].get(user_id, [])
+    return list(conversation_metadata["recent_pdfs"].get(user_id, ()))
 
 def add_message_to_conversation(conversation_id: str, role: str, content: str):
     """Add a message to the conversation history."""
     if conversation_id not in conversation_store:
         return
     
+    now = datetime.utcnow().isoformat()
     message = {
         "role": role,
         "content": content,
-        "timestamp": datetime.utcnow().isoformat()
+        "timestamp": now
     }
     conversation_store[conversation_id]["messages"].append(message)
-    conversation_store[conversation_id]["updated_at"] = datetime.utcnow().isoformat()
+    conversation_store[conversation_id]["updated_at"] = now
+    conversation_store.move_to_end(conversation_id)
     # Update last mapping for this user as well
     try:
         uid = conversation_store[conversation_id]["user_id"]
@@ -1520,16 +1603,21 @@ async def process_file_for_chat(file_path: Path, user_id: str, conversation_id:
     Now also saves to Supabase to create lesson_id for dashboard integration."""
     try:
         # Extract text from file
-        text = pdf_to_text(file_path)
-        chunks = chunk_text(text)
+        text = await asyncio.to_thread(pdf_to_text, file_path)
+        chunks = await asyncio.to_thread(chunk_text, text)
 
-        # Concurrency: embeddings + summary in parallel
+        # Concurrency: embeddings + summary + framework detection in parallel
         summary_task = asyncio.create_task(map_reduce_summary(chunks, explanation_level))
         embeds_task = asyncio.create_task(embed_chunks(chunks))
-        summary, embeds = await asyncio.gather(summary_task, embeds_task)
+        framework_task = asyncio.create_task(detect_multiple_frameworks(text))
+        try:
+            summary, embeds, framework_detection = await asyncio.gather(summary_task, embeds_task, framework_task)
+        except BaseException:
+            # Don't leave Cohere/Groq calls running for an upload that has already failed
+            cancel_pending([summary_task, embeds_task, framework_task])
+            raise
         
         # Detect frameworks with enhanced detection
-        framework_detection = await detect_multiple_frameworks(text)
         primary_framework = framework_detection.get("primary_framework", "GENERIC")
         
         # Get or create conversation
@@ -1540,16 +1628,15 @@ async def process_file_for_chat(file_path: Path, user_id: str, conversation_id:
         store_recent_pdf(user_id, pdf_name, primary_framework, summary)
         
         # Add file context and retrieval data to conversation
-        conversation_store[conv_id]["file_context"] = text
-        conversation_store[conv_id]["chunks"] = chunks
-        conversation_store[conv_id]["chunk_embeddings"] = embeds
-        conversation_store[conv_id]["updated_at"] = datetime.utcnow().isoformat()
+        conversation = conversation_store[conv_id]
+        conversation["file_context"] = text
+        conversation["chunks"] = chunks
+        conversation["chunk_embeddings"] = embeds
+        conversation["updated_at"] = datetime.utcnow().isoformat()
         
         # Update conversation metadata
-        if "metadata" not in conversation_store[conv_id]:
-            conversation_store[conv_id]["metadata"] = {}
-        
-        conversation_store[conv_id]["metadata"].update({
+        conv_metadata = conversation.setdefault("metadata", {})
+        conv_metadata.update({
             "current_pdf": {
                 "name": pdf_name,
                 "framework": primary_framework,
@@ -1583,35 +1670,29 @@ async def process_file_for_chat(file_path: Path, user_id: str, conversation_id:
         # Generate additional content concurrently
         qa_task = asyncio.create_task(gen_flashcards_quiz(summary, explanation_level))
         concept_task = asyncio.create_task(generate_concept_map(summary))
-        qa, concept_map = await asyncio.gather(qa_task, concept_task)
+        try:
+            qa, concept_map = await asyncio.gather(qa_task, concept_task)
+        except BaseException:
+            cancel_pending([qa_task, concept_task])
+            raise
         
         # Insert concept map
         insert_concept_map(lesson_id, concept_map)
         
         # Insert cards (bullets, flashcards, quiz)
-        card_rows = []
-        for i, b in enumerate(summary.split("•")):
-            if b.strip():
-                card_rows.append({
-                    "lesson_id": lesson_id,
-                    "card_type": "bullet",
-                    "payload": {"order": i, "text": b.strip()},
-                    "embed_vector": embeds[min(i, len(embeds)-1)] if embeds else [],
-                })
-        
-        for fc in qa["flashcards"]:
-            card_rows.append({
+        bullets = split_bullets(summary)
+        last_embed = len(embeds) - 1
+        card_rows = [
+            {
                 "lesson_id": lesson_id,
-                "card_type": "flashcard",
-                "payload": fc,
-            })
-        
-        for q in qa["quiz"]:
-            card_rows.append({
-                "lesson_id": lesson_id,
-                "card_type": "quiz",
-                "payload": q,
-            })
+                "card_type": "bullet",
+                "payload": {"order": i, "text": b},
+                "embed_vector": embeds[min(i, last_embed)] if embeds else [],
+            }
+            for i, b in enumerate(bullets)
+        ]
+        card_rows += [{"lesson_id": lesson_id, "card_type": "flashcard", "payload": fc} for fc in qa["flashcards"]]
+        card_rows += [{"lesson_id": lesson_id, "card_type": "quiz", "payload": q} for q in qa["quiz"]]
         
         insert_cards(lesson_id, card_rows)
 
@@ -1621,7 +1702,7 @@ async def process_file_for_chat(file_path: Path, user_id: str, conversation_id:
             "summary": summary,
             "full_text": text,
             "framework": framework_enum.value if hasattr(framework_enum, 'value') else str(framework_enum),
-            "bullets": [b.strip() for b in summary.split("•") if b.strip()],
+            "bullets": bullets,
             "flashcards": qa.get("flashcards", []),
             "quiz": qa.get("quiz", []),
             "concept_map": concept_map,
@@ -1630,7 +1711,7 @@ async def process_file_for_chat(file_path: Path, user_id: str, conversation_id:
         })
         
         # Store lesson_id in conversation metadata for future reference
-        conversation_store[conv_id]["metadata"]["lesson_id"] = lesson_id
+        conv_metadata["lesson_id"] = lesson_id
         
         # Generate personalized response based on framework and content
         system_prompt = f"""You are TrainPI, an AI learning assistant. {get_explanation_prompt(explanation_level)}
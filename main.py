@@ -5,11 +5,13 @@ comprehensive API server with enhanced career guidance, learning management,
 and AI-powered features.
 """
 
-from fastapi import FastAPI, UploadFile, File, HTTPException, Query
+from fastapi import FastAPI, UploadFile, File, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response, ORJSONResponse
 from loguru import logger
-import asyncio, tempfile, os, json
+import asyncio, tempfile, json, hashlib, orjson
 from pathlib import Path
+from collections import OrderedDict
 from schemas import (
     DistillRequest, DistillResponse, LessonCompletion, UserRole, 
     RecommendationRequest, ExplanationLevel, Framework, ChatMessage, 
@@ -27,23 +29,25 @@ from schemas import (
 )
 from distiller import (
     pdf_to_text, chunk_text, embed_chunks, detect_framework, detect_multiple_frameworks,
-    map_reduce_summary, gen_flashcards_quiz, generate_concept_map,
+    map_reduce_summary, gen_flashcards_quiz, generate_concept_map, split_bullets,
     process_chat_message, process_file_for_chat,
     get_conversation_history, get_user_conversations,
-    get_side_menu_data, update_explanation_level, update_framework_preference
+    get_side_menu_data, update_explanation_level, update_framework_preference,
+    get_lesson_cache, set_lesson_cache, generate_retrieval_based_lesson_plan_for_lesson,
+    cancel_pending, close_cohere_client
 )
 from supabase_helper import (
     insert_lesson, insert_cards, insert_concept_map, mark_lesson_completed,
     get_user_completed_lessons, upsert_user_role, get_user_role,
     get_lessons_by_framework, get_user_progress_stats,
     get_lesson_summary, get_lesson_cards, get_lesson_concept_map, get_lesson_by_id,
-    get_lesson_full_text
+    get_lesson_full_text, is_persisted_lesson
 )
 from career_matcher import matcher
 from unified_career_system import unified_career_system
 from dashboard import dashboard_system
 from dotenv import load_dotenv
-from typing import Optional, Dict, List
+from typing import Optional, Dict, List, Tuple, Callable, Awaitable
 from datetime import datetime
 import uuid
 
@@ -77,36 +81,74 @@ async def get_role_based_recommendations(user_id: str, role: str, experience_lev
         logger.error(f"Failed to get role-based recommendations: {e}")
         return []
 
-app = FastAPI(title="TrainPi Microlearning API")
+_ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+class _AppJSONResponse(ORJSONResponse):
+    """orjson-backed default response; tolerates numpy values and non-str dict keys like stdlib json."""
+    def render(self, content) -> bytes:
+        return orjson.dumps(content, option=_ORJSON_OPTIONS)
+
+app = FastAPI(title="TrainPi Microlearning API", default_response_class=_AppJSONResponse)
 
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=[
-        "https://v0-frontend-opal-nine.vercel.app",
-        "https://v0-frontend-opal-nine.vercel.app/",
-        "http://localhost:3000",
-        "http://localhost:3001",
-        "http://127.0.0.1:3000",
-        "http://127.0.0.1:3001",
-        "null",  # For local HTML files opened directly in browser
-        "*"  # Allow all origins for development/testing
-    ],
+    # Browsers never send a trailing slash in Origin, and "*" cannot be honoured with credentials,
+    # so a single anchored pattern covers the deployed frontend and local dev servers.
+    # "null" is deliberately absent: sandboxed iframes and data: pages on any site send it.
+    # Serve local HTML from one of the localhost dev origins instead of opening it as a file.
+    allow_origin_regex=r"https://v0-frontend-opal-nine\.vercel\.app|http://(localhost|127\.0\.0\.1):300[01]",
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
 )
 
+# Static payloads are serialized once at import; "/" and "/health" are polled by liveness probes
+_ROOT_BODY = orjson.dumps({"message": "TrainPI API is running", "status": "healthy", "version": "1.0.0"})
+_HEALTH_BODY = orjson.dumps({"status": "healthy", "service": "TrainPI API", "timestamp": "2024-08-01"})
+_TEST_BODY = orjson.dumps({"message": "API is working correctly", "endpoint": "test"})
+_FRAMEWORKS_BODY = orjson.dumps({
+    "frameworks": [{"value": f.value, "label": f.value.replace("_", " ").title()} for f in Framework]
+})
+
+MAX_UPLOAD_BYTES = 50 * 1024 * 1024  # 50MB limit
+UPLOAD_CHUNK_BYTES = 1 << 16
+IN_MEMORY_PDF_BYTES = 1024 * 1024  # Starlette keeps uploads up to 1MB in memory before spooling to disk
+
+async def _spool_upload(file: UploadFile, dest, hasher=None) -> int:
+    """Copy an upload into dest in fixed-size chunks, enforcing MAX_UPLOAD_BYTES as we go.
+    If a hasher is given it is fed the same chunks, so the digest costs no extra pass."""
+    written = 0
+    while chunk := await file.read(UPLOAD_CHUNK_BYTES):
+        written += len(chunk)
+        if written > MAX_UPLOAD_BYTES:
+            raise HTTPException(413, "File too large. Maximum size is 50MB")
+        dest.write(chunk)
+        if hasher is not None:
+            hasher.update(chunk)
+    return written
+
+# Re-uploads of an identical PDF by the same owner (same level/framework) return the existing lesson (LRU)
+# Structure: { (owner_id, explanation_level, framework, pdf_digest): (lesson_id, preview) }
+_distilled_uploads: "OrderedDict[Tuple[str, str, str, str], Tuple[int, List[str]]]" = OrderedDict()
+DISTILLED_UPLOADS_CAPACITY = 1024
+
+# (lesson_id, action) -> weak ETag last served for stable lesson content; lets revalidations
+# return 304 before any Supabase read or generation. Lesson content doesn't change once stored.
+_lesson_etags: "OrderedDict[Tuple[int, str], str]" = OrderedDict()
+LESSON_ETAGS_CAPACITY = 4096
+LESSON_CACHE_CONTROL = "private, max-age=60"
+
 @app.get("/")
 async def root():
-    return {"message": "TrainPI API is running", "status": "healthy", "version": "1.0.0"}
+    return Response(content=_ROOT_BODY, media_type="application/json")
 
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy", "service": "TrainPI API", "timestamp": "2024-08-01"}
+    return Response(content=_HEALTH_BODY, media_type="application/json")
 
 @app.get("/api/test")
 async def test_endpoint():
-    return {"message": "API is working correctly", "endpoint": "test"}
+    return Response(content=_TEST_BODY, media_type="application/json")
 
 @app.get("/api/debug/lesson/{lesson_id}")
 async def debug_lesson_content(lesson_id: int):
@@ -147,78 +189,119 @@ async def distill_pdf(
     if not file.filename.endswith(".pdf"):
         raise HTTPException(400, "Only PDF files are supported")
     
-    if not file.size or file.size > 50 * 1024 * 1024:  # 50MB limit
-        raise HTTPException(413, "File too large. Maximum size is 50MB")
-    
     tmp = None
     try:
-        # Create temporary file
-        tmp = tempfile.NamedTemporaryFile(delete=False, suffix=".pdf")
-        content = await file.read()
-        tmp.write(content)
-        tmp.close()
+        hasher = hashlib.blake2b(digest_size=16)
+        if file.size is not None and file.size <= IN_MEMORY_PDF_BYTES:
+            # Small uploads are still held in memory by Starlette's spool; parse them directly
+            pdf_source = await file.read()
+            if not pdf_source:
+                raise HTTPException(400, "Uploaded file is empty")
+            hasher.update(pdf_source)
+        else:
+            # Stream the upload to a temporary file; the size limit is enforced on bytes actually
+            # received rather than the client-reported size
+            tmp = tempfile.NamedTemporaryFile(delete=False, suffix=".pdf")
+            written = await _spool_upload(file, tmp, hasher)
+            tmp.close()
+            if not written:
+                raise HTTPException(400, "Uploaded file is empty")
+            pdf_source = Path(tmp.name)
+        
+        # Skip the whole LLM pipeline if this owner already distilled the same bytes
+        upload_key = (owner_id, explanation_level.value, framework.value, hasher.hexdigest())
+        existing = _distilled_uploads.get(upload_key)
+        if existing is not None and get_lesson_by_id(existing[0]) is None:
+            # The lesson is gone (or unreadable); forget it and distill again
+            del _distilled_uploads[upload_key]
+            existing = None
+        if existing is not None:
+            _distilled_uploads.move_to_end(upload_key)
+            lesson_id, preview = existing
+            logger.info(f"Identical PDF already distilled for owner {owner_id}; reusing lesson {lesson_id}")
+            return {
+                "lesson_id": lesson_id,
+                "actions": ["summary", "lesson", "quiz", "flashcards", "workflow"],
+                "preview": preview
+            }
         
         # Extract text and process with proper error handling
         try:
-            text = pdf_to_text(Path(tmp.name))
+            # PyMuPDF parsing is CPU-bound; keep it off the event loop
+            text = await asyncio.to_thread(pdf_to_text, pdf_source)
             if not text or len(text.strip()) < 10:
                 raise HTTPException(422, "Failed to extract text from PDF - the file might be scanned or corrupted")
         except Exception as pdf_error:
             logger.error(f"PDF text extraction failed: {pdf_error}")
             raise HTTPException(422, "Failed to process PDF – maybe it's scanned or has no selectable text?")
         
-        chunks = chunk_text(text)
+        chunks = await asyncio.to_thread(chunk_text, text)
         logger.info(f"{len(chunks)} chunks created")
         
         if not chunks:
             raise HTTPException(422, "No content could be extracted from the PDF")
         
-        # Auto-detect framework if not specified
-        if framework == Framework.GENERIC:
-            framework = await detect_framework(text)
-            logger.info(f"Auto-detected framework: {framework}")
-        
-        embeds = await embed_chunks(chunks)
-        summary = await map_reduce_summary(chunks, explanation_level)
-        qa = await gen_flashcards_quiz(summary, explanation_level)
-        concept_map = await generate_concept_map(summary)
+        # Pipeline: embeddings and framework detection need only the chunks/text, so they
+        # start now and run underneath the summary and the summary-derived stages
+        pipeline_tasks = []
+        try:
+            embeds_task = asyncio.create_task(embed_chunks(chunks))
+            pipeline_tasks.append(embeds_task)
+            framework_task = None
+            if framework == Framework.GENERIC:
+                framework_task = asyncio.create_task(detect_framework(text))
+                pipeline_tasks.append(framework_task)
+            
+            summary = await map_reduce_summary(chunks, explanation_level)
+            
+            # Flashcards/quiz and concept map both derive from the summary but not from each other
+            qa_task = asyncio.create_task(gen_flashcards_quiz(summary, explanation_level))
+            concept_map_task = asyncio.create_task(generate_concept_map(summary))
+            pipeline_tasks += [qa_task, concept_map_task]
+            qa, concept_map, embeds = await asyncio.gather(qa_task, concept_map_task, embeds_task)
+            if framework_task is not None:
+                framework = await framework_task
+                logger.info(f"Auto-detected framework: {framework}")
+        except BaseException:
+            # Don't leave Cohere/Groq calls running for a request that has already failed
+            cancel_pending(pipeline_tasks)
+            raise
         
         # Save to Supabase
         lesson_id = insert_lesson(owner_id, file.filename, summary, framework, explanation_level)
         
         # Insert concept map
-        insert_concept_map(lesson_id, concept_map)
+        stored = is_persisted_lesson(lesson_id)
+        stored &= insert_concept_map(lesson_id, concept_map)
         
-        # Insert cards (bullets, flashcards, quiz)
-        card_rows = []
-        for i, b in enumerate(summary.split("•")):
-            if b.strip():
-                card_rows.append({
-                    "lesson_id": lesson_id,
-                    "card_type": "bullet",
-                    "payload": {"order": i, "text": b.strip()},
-                    "embed_vector": embeds[min(i, len(embeds)-1)] if embeds else [],
-                })
-        
-        for fc in qa["flashcards"]:
-            card_rows.append({
-                "lesson_id": lesson_id,
-                "card_type": "flashcard",
-                "payload": fc,
-            })
+        # Split the summary once; the same list feeds the bullet cards and the preview
+        bullets = split_bullets(summary)
         
-        for q in qa["quiz"]:
-            card_rows.append({
+        # Insert cards (bullets, flashcards, quiz)
+        last_embed = len(embeds) - 1
+        card_rows = [
+            {
                 "lesson_id": lesson_id,
-                "card_type": "quiz",
-                "payload": q,
-            })
+                "card_type": "bullet",
+                "payload": {"order": i, "text": b},
+                "embed_vector": embeds[min(i, last_embed)] if embeds else [],
+            }
+            for i, b in enumerate(bullets)
+        ]
+        card_rows += [{"lesson_id": lesson_id, "card_type": "flashcard", "payload": fc} for fc in qa["flashcards"]]
+        card_rows += [{"lesson_id": lesson_id, "card_type": "quiz", "payload": q} for q in qa["quiz"]]
         
-        insert_cards(lesson_id, card_rows)
+        stored &= insert_cards(lesson_id, card_rows)
         
         # Get preview bullets (first 3)
-        bullets = [b.strip() for b in summary.split("•") if b.strip()]
-        preview = bullets[:3] if len(bullets) >= 3 else bullets
+        preview = bullets[:3]
+        
+        # Only remember uploads whose lesson really landed in Supabase; a fallback id would
+        # otherwise be handed back for every re-upload of this PDF
+        if stored:
+            _distilled_uploads[upload_key] = (lesson_id, preview)
+            while len(_distilled_uploads) > DISTILLED_UPLOADS_CAPACITY:
+                _distilled_uploads.popitem(last=False)
         
         return {
             "lesson_id": lesson_id,
@@ -232,162 +315,148 @@ async def distill_pdf(
         logger.error(f"Distill processing failed: {e}")
         raise HTTPException(500, f"Failed to process PDF: {str(e)}")
     finally:
-        if tmp and os.path.exists(tmp.name):
-            try:
-                os.unlink(tmp.name)
-            except:
-                pass
+        if tmp is not None:
+            tmp.close()  # no-op if already closed; covers an aborted spool
+            Path(tmp.name).unlink(missing_ok=True)
 
 @app.get("/api/lesson/{lesson_id}/{action}")
-async def lesson_action(lesson_id: int, action: str):
-    """Handle different lesson actions like summary, quiz, etc."""
-    try:
-        if action == "summary":
-            # 1) Prefer in-memory cache populated during upload
-            try:
-                from distiller import get_lesson_cache
-                cached = get_lesson_cache(str(lesson_id)) or {}
-                if cached.get("bullets"):
-                    return {"content": cached.get("bullets")}
-            except Exception:
-                pass
-            # 2) Then Supabase
-            summary = get_lesson_summary(lesson_id)
-            if summary:
-                bullets = [b.strip() for b in summary.split("•") if b.strip()]
-                return {"content": bullets}
-            # 3) Finally, generate on-demand
-            logger.info(f"Summary not found for lesson {lesson_id}, generating on-demand")
-            summary_content = await _generate_summary_on_demand(lesson_id)
-            try:
-                from distiller import set_lesson_cache
-                cached = cached if isinstance(cached, dict) else {}
-                cached["bullets"] = summary_content
-                set_lesson_cache(str(lesson_id), cached)
-            except Exception:
-                pass
-            return {"content": summary_content}
-        
-        elif action == "quiz":
-            # 1) Prefer in-memory cache
-            try:
-                from distiller import get_lesson_cache
-                cached = get_lesson_cache(str(lesson_id)) or {}
-                if cached.get("quiz"):
-                    return {"content": {"questions": cached.get("quiz")}}
-            except Exception:
-                pass
-            # 2) Supabase
-            quiz_cards = get_lesson_cards(lesson_id, "quiz")
-            if quiz_cards:
-                questions = [card["payload"] for card in quiz_cards]
-                return {"content": {"questions": questions}}
-            # 3) On-demand
-            logger.info(f"Quiz not found for lesson {lesson_id}, generating on-demand")
-            quiz_content = await _generate_quiz_on_demand(lesson_id)
-            try:
-                from distiller import set_lesson_cache
-                cached = cached if isinstance(cached, dict) else {}
-                cached["quiz"] = quiz_content
-                set_lesson_cache(str(lesson_id), cached)
-            except Exception:
-                pass
-            return {"content": {"questions": quiz_content}}
-        
-        elif action == "flashcards":
-            # 1) Prefer in-memory cache
-            try:
-                from distiller import get_lesson_cache
-                cached = get_lesson_cache(str(lesson_id)) or {}
-                if cached.get("flashcards"):
-                    return {"content": {"cards": cached.get("flashcards")}}
-            except Exception:
-                pass
-            # 2) Supabase
-            flashcard_cards = get_lesson_cards(lesson_id, "flashcard")
-            if flashcard_cards:
-                cards = [card["payload"] for card in flashcard_cards]
-                return {"content": {"cards": cards}}
-            # 3) On-demand
-            logger.info(f"Flashcards not found for lesson {lesson_id}, generating on-demand")
-            flashcard_content = await _generate_flashcards_on_demand(lesson_id)
-            try:
-                from distiller import set_lesson_cache
-                cached = cached if isinstance(cached, dict) else {}
-                cached["flashcards"] = flashcard_content
-                set_lesson_cache(str(lesson_id), cached)
-            except Exception:
-                pass
-            return {"content": {"cards": flashcard_content}}
-        
-        elif action == "lesson":
-            # 1) Prefer in-memory cache
-            try:
-                from distiller import get_lesson_cache
-                cached = get_lesson_cache(str(lesson_id)) or {}
-            except Exception:
-                cached = {}
-            # 2) Supabase lesson data
-            lesson_data = get_lesson_by_id(lesson_id) or {}
-            # bullets
-            bullets = []
-            if cached.get("bullets"):
-                bullets = cached.get("bullets")
-            else:
-                bullet_cards = get_lesson_cards(lesson_id, "bullet")
-                bullets = [card.get("payload", {}).get("text") for card in bullet_cards if card.get("payload", {}).get("text")]
-            # concept map
-            concept_map = cached.get("concept_map") or get_lesson_concept_map(lesson_id)
-            framework_value = (lesson_data.get("framework") if isinstance(lesson_data, dict) else None) or cached.get("framework") or "generic"
-            # Retrieval-based lesson plan
-            try:
-                from distiller import generate_retrieval_based_lesson_plan_for_lesson
-                lesson_plan = await generate_retrieval_based_lesson_plan_for_lesson(lesson_id, ExplanationLevel.INTERN, framework_value)
-            except Exception:
-                lesson_plan = {"title": "Learning Plan", "learning_topics": [], "learning_path": []}
-            # Title and summary
-            title = (lesson_data.get("title") if isinstance(lesson_data, dict) else None) or cached.get("title") or "Untitled Lesson"
-            summary_val = (lesson_data.get("summary") if isinstance(lesson_data, dict) else None) or cached.get("summary") or ""
-            content = {
-                "title": title,
-                "summary": summary_val,
-                "framework": framework_value,
-                "bullets": bullets,
-                "concept_map": concept_map,
-                "lesson_plan": lesson_plan
-            }
-            # Save plan in cache
-            try:
-                from distiller import set_lesson_cache
-                tmp = cached if isinstance(cached, dict) else {}
-                tmp["lesson_plan"] = lesson_plan
-                set_lesson_cache(str(lesson_id), tmp)
-            except Exception:
-                pass
-            return {"content": content}
-        
-        elif action == "workflow":
-            # For workflow, we'll generate a simple workflow from the concept map
-            concept_map = get_lesson_concept_map(lesson_id)
-            if concept_map and concept_map.get("nodes"):
-                workflow_steps = [node.get("title", "Step") for node in concept_map["nodes"]]
-                return {"content": {"workflow": workflow_steps}}
-            else:
-                # Generate workflow on-demand if not found in Supabase
-                logger.info(f"Workflow not found in Supabase for lesson {lesson_id}, generating on-demand")
-                workflow_content = await _generate_workflow_on_demand(lesson_id)
-                try:
-                    from distiller import get_lesson_cache, set_lesson_cache
-                    cached = get_lesson_cache(str(lesson_id)) or {}
-                    cached["workflow"] = workflow_content
-                    set_lesson_cache(str(lesson_id), cached)
-                except Exception:
-                    pass
-                return {"content": {"workflow": workflow_content}}
-        
-        else:
-            raise HTTPException(400, f"Unknown action: {action}")
-            
+async def lesson_action(lesson_id: int, action: str, request: Request):
+    """Handle different lesson actions like summary, quiz, etc.
+    Content served from the lesson cache or Supabase carries a weak ETag; a revalidation matching the
+    ETag we last served for (lesson_id, action) gets a 304 without any Supabase read or generation.
+    On-demand/fallback content and the (non-deterministic) full lesson are sent without validators."""
+    key = (lesson_id, action)
+    if_none_match = request.headers.get("if-none-match", "")
+    known_etag = _lesson_etags.get(key)
+    if known_etag is not None and known_etag in if_none_match:
+        _lesson_etags.move_to_end(key)
+        return Response(status_code=304, headers={"ETag": known_etag, "Cache-Control": LESSON_CACHE_CONTROL})
+    
+    content, stable = await _lesson_action_content(lesson_id, action)
+    body = orjson.dumps(content, option=_ORJSON_OPTIONS)
+    if not stable:
+        _lesson_etags.pop(key, None)
+        return Response(content=body, media_type="application/json")
+    
+    etag = f'W/"{hashlib.blake2b(body, digest_size=12).hexdigest()}"'
+    _lesson_etags[key] = etag
+    while len(_lesson_etags) > LESSON_ETAGS_CAPACITY:
+        _lesson_etags.popitem(last=False)
+    headers = {"ETag": etag, "Cache-Control": LESSON_CACHE_CONTROL}
+    if etag in if_none_match:
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+# Lesson action handlers return (payload, stable): stable payloads come from the lesson cache or
+# Supabase and can be revalidated by ETag; on-demand generations may be placeholders and are not
+async def _lesson_summary(lesson_id: int) -> Tuple[Dict, bool]:
+    # 1) Prefer in-memory cache populated during upload
+    cached = get_lesson_cache(str(lesson_id)) or {}
+    if cached.get("bullets"):
+        return {"content": cached.get("bullets")}, True
+    # 2) Then Supabase
+    summary = get_lesson_summary(lesson_id)
+    if summary:
+        return {"content": split_bullets(summary)}, True
+    # 3) Finally, generate on-demand
+    logger.info(f"Summary not found for lesson {lesson_id}, generating on-demand")
+    summary_content = await _generate_summary_on_demand(lesson_id)
+    cached["bullets"] = summary_content
+    set_lesson_cache(str(lesson_id), cached)
+    return {"content": summary_content}, False
+
+async def _lesson_quiz(lesson_id: int) -> Tuple[Dict, bool]:
+    # 1) Prefer in-memory cache
+    cached = get_lesson_cache(str(lesson_id)) or {}
+    if cached.get("quiz"):
+        return {"content": {"questions": cached.get("quiz")}}, True
+    # 2) Supabase
+    quiz_cards = get_lesson_cards(lesson_id, "quiz")
+    if quiz_cards:
+        return {"content": {"questions": [card["payload"] for card in quiz_cards]}}, True
+    # 3) On-demand
+    logger.info(f"Quiz not found for lesson {lesson_id}, generating on-demand")
+    quiz_content = await _generate_quiz_on_demand(lesson_id)
+    cached["quiz"] = quiz_content
+    set_lesson_cache(str(lesson_id), cached)
+    return {"content": {"questions": quiz_content}}, False
+
+async def _lesson_flashcards(lesson_id: int) -> Tuple[Dict, bool]:
+    # 1) Prefer in-memory cache
+    cached = get_lesson_cache(str(lesson_id)) or {}
+    if cached.get("flashcards"):
+        return {"content": {"cards": cached.get("flashcards")}}, True
+    # 2) Supabase
+    flashcard_cards = get_lesson_cards(lesson_id, "flashcard")
+    if flashcard_cards:
+        return {"content": {"cards": [card["payload"] for card in flashcard_cards]}}, True
+    # 3) On-demand
+    logger.info(f"Flashcards not found for lesson {lesson_id}, generating on-demand")
+    flashcard_content = await _generate_flashcards_on_demand(lesson_id)
+    cached["flashcards"] = flashcard_content
+    set_lesson_cache(str(lesson_id), cached)
+    return {"content": {"cards": flashcard_content}}, False
+
+async def _lesson_full(lesson_id: int) -> Tuple[Dict, bool]:
+    # 1) Prefer in-memory cache
+    cached = get_lesson_cache(str(lesson_id)) or {}
+    # 2) Supabase lesson data
+    lesson_data = get_lesson_by_id(lesson_id) or {}
+    # bullets
+    if cached.get("bullets"):
+        bullets = cached.get("bullets")
+    else:
+        bullet_cards = get_lesson_cards(lesson_id, "bullet")
+        bullets = [card.get("payload", {}).get("text") for card in bullet_cards if card.get("payload", {}).get("text")]
+    # concept map
+    concept_map = cached.get("concept_map") or get_lesson_concept_map(lesson_id)
+    framework_value = lesson_data.get("framework") or cached.get("framework") or "generic"
+    # Retrieval-based lesson plan
+    try:
+        lesson_plan = await generate_retrieval_based_lesson_plan_for_lesson(lesson_id, ExplanationLevel.INTERN, framework_value)
+    except Exception:
+        lesson_plan = {"title": "Learning Plan", "learning_topics": [], "learning_path": []}
+    content = {
+        "title": lesson_data.get("title") or cached.get("title") or "Untitled Lesson",
+        "summary": lesson_data.get("summary") or cached.get("summary") or "",
+        "framework": framework_value,
+        "bullets": bullets,
+        "concept_map": concept_map,
+        "lesson_plan": lesson_plan
+    }
+    # Save plan in cache
+    cached["lesson_plan"] = lesson_plan
+    set_lesson_cache(str(lesson_id), cached)
+    # The lesson plan is regenerated by Groq on every call, so this is never stable
+    return {"content": content}, False
+
+async def _lesson_workflow(lesson_id: int) -> Tuple[Dict, bool]:
+    # For workflow, we'll generate a simple workflow from the concept map
+    concept_map = get_lesson_concept_map(lesson_id)
+    if concept_map and concept_map.get("nodes"):
+        return {"content": {"workflow": [node.get("title", "Step") for node in concept_map["nodes"]]}}, True
+    # Generate workflow on-demand if not found in Supabase
+    logger.info(f"Workflow not found in Supabase for lesson {lesson_id}, generating on-demand")
+    workflow_content = await _generate_workflow_on_demand(lesson_id)
+    cached = get_lesson_cache(str(lesson_id)) or {}
+    cached["workflow"] = workflow_content
+    set_lesson_cache(str(lesson_id), cached)
+    return {"content": {"workflow": workflow_content}}, False
+
+_LESSON_ACTIONS: Dict[str, Callable[[int], Awaitable[Tuple[Dict, bool]]]] = {
+    "summary": _lesson_summary,
+    "quiz": _lesson_quiz,
+    "flashcards": _lesson_flashcards,
+    "lesson": _lesson_full,
+    "workflow": _lesson_workflow,
+}
+
+async def _lesson_action_content(lesson_id: int, action: str) -> Tuple[Dict, bool]:
+    handler = _LESSON_ACTIONS.get(action)
+    if handler is None:
+        raise HTTPException(400, f"Unknown action: {action}")
+    try:
+        return await handler(lesson_id)
     except HTTPException:
         raise
     except Exception as e:
@@ -397,7 +466,8 @@ async def lesson_action(lesson_id: int, action: str):
 @app.post("/api/lesson/{lesson_id}/{action}")
 async def lesson_action_post(lesson_id: int, action: str):
     """POST endpoint for lesson actions - alternative to GET"""
-    return await lesson_action(lesson_id, action)
+    content, _ = await _lesson_action_content(lesson_id, action)
+    return content
 
 @app.post("/api/chat/lesson/summary")
 async def get_lesson_summary_chat(lesson_id: int, user_id: str):
@@ -405,7 +475,7 @@ async def get_lesson_summary_chat(lesson_id: int, user_id: str):
     try:
         summary = get_lesson_summary(lesson_id)
         if summary:
-            bullets = [b.strip() for b in summary.split("•") if b.strip()]
+            bullets = split_bullets(summary)
             return {"content": bullets}
         else:
             # Generate summary on-demand for chat
@@ -438,7 +508,7 @@ async def get_lesson_content_for_chat(lesson_id: int, user_id: Optional[str] = N
         if not summary:
             summary_bullets = await _generate_summary_on_demand(lesson_id)
         else:
-            summary_bullets = [b.strip() for b in summary.split("•") if b.strip()]
+            summary_bullets = split_bullets(summary)
         
         # Get quiz content
         quiz_cards = get_lesson_cards(lesson_id, "quiz")
@@ -512,14 +582,12 @@ async def ingest_distilled_lesson(
         
         # Add lesson context to conversation (use full text if available, otherwise summary)
         context_text = full_text if full_text else summary
-        conversation_store[conv_id]["file_context"] = context_text
-        conversation_store[conv_id]["updated_at"] = datetime.utcnow().isoformat()
+        conversation = conversation_store[conv_id]
+        conversation["file_context"] = context_text
+        conversation["updated_at"] = datetime.utcnow().isoformat()
         
         # Update conversation metadata
-        if "metadata" not in conversation_store[conv_id]:
-            conversation_store[conv_id]["metadata"] = {}
-        
-        conversation_store[conv_id]["metadata"].update({
+        conversation.setdefault("metadata", {}).update({
             "current_lesson": {
                 "lesson_id": lesson_id,
                 "title": lesson_data.get("title", "Unknown Lesson"),
@@ -600,9 +668,10 @@ async def upload_file_for_chat(
     if not file.filename.endswith(".pdf"):
         raise HTTPException(400, "PDF only")
     
+    tmp = None
     try:
         tmp = tempfile.NamedTemporaryFile(delete=False, suffix=".pdf")
-        tmp.write(await file.read())
+        await _spool_upload(file, tmp)
         tmp.close()
         
         result = await process_file_for_chat(
@@ -612,6 +681,8 @@ async def upload_file_for_chat(
             explanation_level
         )
         
+    except HTTPException:
+        raise
     except RuntimeError as e:
         logger.error(f"File processing failed: {e}")
         raise HTTPException(500, str(e))
@@ -619,7 +690,9 @@ async def upload_file_for_chat(
         logger.error(f"Unexpected error: {e}")
         raise HTTPException(500, "Internal server error.")
     finally:
-        os.unlink(tmp.name)
+        if tmp is not None:
+            tmp.close()  # no-op if already closed; covers an aborted spool
+            Path(tmp.name).unlink(missing_ok=True)
     
     return ChatResponse(**result)
 
@@ -678,26 +751,6 @@ async def update_user_framework_preference(user_id: str, framework: str):
         raise HTTPException(500, "Failed to update framework preference")
 
 
-# Missing helper functions from app.py
-def _generate_fallback_concept_map() -> Dict:
-    """Generate impressive fallback concept map"""
-    return {
-        "nodes": [
-            {"id": "1", "title": "API Design", "type": "concept"},
-            {"id": "2", "title": "Security", "type": "concept"},
-            {"id": "3", "title": "Performance", "type": "concept"},
-            {"id": "4", "title": "Testing", "type": "concept"},
-            {"id": "5", "title": "Deployment", "type": "concept"}
-        ],
-        "edges": [
-            {"source": "1", "target": "2", "label": "requires"},
-            {"source": "1", "target": "3", "label": "affects"},
-            {"source": "2", "target": "4", "label": "validated by"},
-            {"source": "3", "target": "5", "label": "optimized for"},
-            {"source": "4", "target": "5", "label": "ensures quality"}
-        ]
-    }
-
 # Career matching endpoints
 @app.get("/api/career/quiz", response_model=CareerQuizResponse)
 async def get_career_quiz():
@@ -887,8 +940,7 @@ async def get_lessons_by_framework_endpoint(framework: Framework, limit: int = 1
 @app.get("/api/frameworks")
 async def get_available_frameworks():
     """Get list of available frameworks."""
-    frameworks = [{"value": f.value, "label": f.value.replace("_", " ").title()} for f in Framework]
-    return {"frameworks": frameworks}
+    return Response(content=_FRAMEWORKS_BODY, media_type="application/json")
 
 # App startup hook to precompute micro-lesson embeddings
 @app.on_event("startup")
@@ -900,6 +952,11 @@ async def _startup():
     except Exception as e:
         logger.warning(f"Failed precomputing micro-lessons: {e}")
 
+@app.on_event("shutdown")
+async def _shutdown():
+    await matcher.close()
+    await close_cohere_client()
+
 # -----------------
 # Supabase debug APIs
 # -----------------
@@ -1612,85 +1669,90 @@ async def _generate_flashcards_on_demand(lesson_id: int) -> List[Dict]:
         logger.error(f"Failed to generate flashcards on-demand: {e}")
         return _generate_fallback_flashcards()
 
+# Fallback payloads are built once at import; helpers hand out shallow copies
+_FALLBACK_QUIZ = (
+    {
+        "question": "What is the primary purpose of API design?",
+        "options": [
+            "To make code run faster",
+            "To provide a clear interface for data exchange",
+            "To reduce file sizes",
+            "To add more colors to the UI"
+        ],
+        "answer": "b"
+    },
+    {
+        "question": "Which of the following is a best practice for error handling?",
+        "options": [
+            "Ignore all errors",
+            "Use try-catch blocks appropriately",
+            "Always use global error handlers",
+            "Never handle errors"
+        ],
+        "answer": "b"
+    },
+    {
+        "question": "What does REST stand for in RESTful APIs?",
+        "options": [
+            "Remote Execution System Transfer",
+            "Representational State Transfer",
+            "Real-time Event Streaming Technology",
+            "Rapid Endpoint Service Transfer"
+        ],
+        "answer": "b"
+    },
+    {
+        "question": "Which HTTP method is typically used for creating new resources?",
+        "options": [
+            "GET",
+            "POST",
+            "PUT",
+            "DELETE"
+        ],
+        "answer": "b"
+    },
+    {
+        "question": "What is the purpose of middleware in web applications?",
+        "options": [
+            "To make the app slower",
+            "To process requests before they reach the main handler",
+            "To only handle database operations",
+            "To replace the main application logic"
+        ],
+        "answer": "b"
+    }
+)
+
 def _generate_fallback_quiz() -> List[Dict]:
     """Generate sophisticated fallback quiz questions"""
-    return [
-        {
-            "question": "What is the primary purpose of API design?",
-            "options": [
-                "To make code run faster",
-                "To provide a clear interface for data exchange",
-                "To reduce file sizes",
-                "To add more colors to the UI"
-            ],
-            "answer": "b"
-        },
-        {
-            "question": "Which of the following is a best practice for error handling?",
-            "options": [
-                "Ignore all errors",
-                "Use try-catch blocks appropriately",
-                "Always use global error handlers",
-                "Never handle errors"
-            ],
-            "answer": "b"
-        },
-        {
-            "question": "What does REST stand for in RESTful APIs?",
-            "options": [
-                "Remote Execution System Transfer",
-                "Representational State Transfer",
-                "Real-time Event Streaming Technology",
-                "Rapid Endpoint Service Transfer"
-            ],
-            "answer": "b"
-        },
-        {
-            "question": "Which HTTP method is typically used for creating new resources?",
-            "options": [
-                "GET",
-                "POST",
-                "PUT",
-                "DELETE"
-            ],
-            "answer": "b"
-        },
-        {
-            "question": "What is the purpose of middleware in web applications?",
-            "options": [
-                "To make the app slower",
-                "To process requests before they reach the main handler",
-                "To only handle database operations",
-                "To replace the main application logic"
-            ],
-            "answer": "b"
-        }
-    ]
+    return list(_FALLBACK_QUIZ)
+
+_FALLBACK_FLASHCARDS = (
+    {
+        "front": "What is an API?",
+        "back": "An Application Programming Interface (API) is a set of rules and protocols that allows different software applications to communicate with each other."
+    },
+    {
+        "front": "What is the difference between GET and POST?",
+        "back": "GET requests retrieve data and are idempotent, while POST requests submit data and may change server state."
+    },
+    {
+        "front": "What is error handling?",
+        "back": "Error handling is the process of anticipating, detecting, and resolving programming, application, or communication errors."
+    },
+    {
+        "front": "What is middleware?",
+        "back": "Middleware is software that acts as a bridge between different applications, allowing them to communicate and share data."
+    },
+    {
+        "front": "What is a RESTful API?",
+        "back": "A RESTful API follows REST principles, using HTTP methods to perform CRUD operations on resources in a stateless manner."
+    }
+)
 
 def _generate_fallback_flashcards() -> List[Dict]:
     """Generate sophisticated fallback flashcards"""
-    return [
-        {
-            "front": "What is an API?",
-            "back": "An Application Programming Interface (API) is a set of rules and protocols that allows different software applications to communicate with each other."
-        },
-        {
-            "front": "What is the difference between GET and POST?",
-            "back": "GET requests retrieve data and are idempotent, while POST requests submit data and may change server state."
-        },
-        {
-            "front": "What is error handling?",
-            "back": "Error handling is the process of anticipating, detecting, and resolving programming, application, or communication errors."
-        },
-        {
-            "front": "What is middleware?",
-            "back": "Middleware is software that acts as a bridge between different applications, allowing them to communicate and share data."
-        },
-        {
-            "front": "What is a RESTful API?",
-            "back": "A RESTful API follows REST principles, using HTTP methods to perform CRUD operations on resources in a stateless manner."
-        }
-    ]
+    return list(_FALLBACK_FLASHCARDS)
 
 async def _generate_summary_on_demand(lesson_id: int) -> List[str]:
     """Generate impressive summary on-demand when Supabase data is not available"""
@@ -1698,7 +1760,7 @@ async def _generate_summary_on_demand(lesson_id: int) -> List[str]:
         # Try to get summary from Supabase first
         summary = get_lesson_summary(lesson_id)
         if summary:
-            bullets = [b.strip() for b in summary.split("•") if b.strip()]
+            bullets = split_bullets(summary)
             return bullets
         
         # Generate sophisticated fallback summary
@@ -1745,18 +1807,20 @@ async def _generate_workflow_on_demand(lesson_id: int) -> List[str]:
         logger.error(f"Failed to generate workflow on-demand: {e}")
         return _generate_fallback_workflow()
 
+_FALLBACK_SUMMARY = (
+    "🎯 **API Design Principles**: Understand RESTful architecture, HTTP methods, and resource modeling",
+    "🔧 **Error Handling**: Implement robust try-catch blocks, proper status codes, and meaningful error messages",
+    "🛡️ **Security Best Practices**: Use authentication, authorization, input validation, and HTTPS",
+    "📊 **Data Validation**: Implement request/response validation, type checking, and sanitization",
+    "⚡ **Performance Optimization**: Use caching, pagination, compression, and efficient database queries",
+    "🔍 **Testing Strategies**: Unit tests, integration tests, API testing, and automated CI/CD pipelines",
+    "📚 **Documentation**: Create comprehensive API docs with examples, schemas, and usage guidelines",
+    "🔄 **Versioning**: Implement API versioning strategies for backward compatibility"
+)
+
 def _generate_fallback_summary() -> List[str]:
     """Generate impressive fallback summary"""
-    return [
-        "🎯 **API Design Principles**: Understand RESTful architecture, HTTP methods, and resource modeling",
-        "🔧 **Error Handling**: Implement robust try-catch blocks, proper status codes, and meaningful error messages",
-        "🛡️ **Security Best Practices**: Use authentication, authorization, input validation, and HTTPS",
-        "📊 **Data Validation**: Implement request/response validation, type checking, and sanitization",
-        "⚡ **Performance Optimization**: Use caching, pagination, compression, and efficient database queries",
-        "🔍 **Testing Strategies**: Unit tests, integration tests, API testing, and automated CI/CD pipelines",
-        "📚 **Documentation**: Create comprehensive API docs with examples, schemas, and usage guidelines",
-        "🔄 **Versioning**: Implement API versioning strategies for backward compatibility"
-    ]
+    return list(_FALLBACK_SUMMARY)
 
 def _generate_fallback_lesson() -> Dict:
     """Generate impressive fallback lesson content"""
@@ -1768,18 +1832,20 @@ def _generate_fallback_lesson() -> Dict:
         "concept_map": _generate_fallback_concept_map()
     }
 
+_FALLBACK_WORKFLOW = (
+    "📋 **1. Planning & Design**: Define API requirements, endpoints, and data models",
+    "🏗️ **2. Architecture Setup**: Choose framework, database, and deployment strategy",
+    "🔧 **3. Core Development**: Implement endpoints, validation, and business logic",
+    "🛡️ **4. Security Implementation**: Add authentication, authorization, and input validation",
+    "🧪 **5. Testing & Quality**: Write unit tests, integration tests, and API documentation",
+    "📊 **6. Performance Optimization**: Implement caching, pagination, and monitoring",
+    "🚀 **7. Deployment & CI/CD**: Set up automated deployment and continuous integration",
+    "📈 **8. Monitoring & Maintenance**: Monitor performance, handle errors, and iterate improvements"
+)
+
 def _generate_fallback_workflow() -> List[str]:
     """Generate impressive fallback workflow"""
-    return [
-        "📋 **1. Planning & Design**: Define API requirements, endpoints, and data models",
-        "🏗️ **2. Architecture Setup**: Choose framework, database, and deployment strategy",
-        "🔧 **3. Core Development**: Implement endpoints, validation, and business logic",
-        "🛡️ **4. Security Implementation**: Add authentication, authorization, and input validation",
-        "🧪 **5. Testing & Quality**: Write unit tests, integration tests, and API documentation",
-        "📊 **6. Performance Optimization**: Implement caching, pagination, and monitoring",
-        "🚀 **7. Deployment & CI/CD**: Set up automated deployment and continuous integration",
-        "📈 **8. Monitoring & Maintenance**: Monitor performance, handle errors, and iterate improvements"
-    ]
+    return list(_FALLBACK_WORKFLOW)
 
 def _generate_fallback_concept_map() -> Dict:
     """Generate impressive fallback concept map"""
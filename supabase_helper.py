@@ -1,4 +1,5 @@
-import os, supabase, orjson
+import os, time, supabase, orjson
+from collections import OrderedDict
 from loguru import logger
 from datetime import datetime
 from typing import List, Dict, Optional
@@ -28,12 +29,53 @@ try:
 except Exception as e:
     logger.warning(f"Failed to initialize Supabase client: {e}. Running in test mode.")
 
-def insert_lesson(owner_id: str, title: str, summary: str, framework: Framework = Framework.GENERIC, explanation_level: ExplanationLevel = ExplanationLevel.INTERN, full_text: str = None) -> int:
+# Read-through cache for lesson rows, which are effectively immutable once distilled (TTL + LRU)
+# Structure: { (kind, lesson_id, *extra): (stored_at_monotonic, value) }
+_lesson_read_cache: "OrderedDict[tuple, tuple]" = OrderedDict()
+LESSON_READ_CACHE_TTL_SECONDS = 600
+LESSON_READ_CACHE_CAPACITY = 2048
+
+def _read_cache_get(key: tuple):
+    rec = _lesson_read_cache.get(key)
+    if rec is None:
+        return None
+    if time.monotonic() - rec[0] > LESSON_READ_CACHE_TTL_SECONDS:
+        _lesson_read_cache.pop(key, None)
+        return None
+    _lesson_read_cache.move_to_end(key)
+    return rec[1]
+
+def _read_cache_set(key: tuple, value):
+    # Misses (None / empty) are not cached so freshly inserted rows become visible immediately
+    if not value:
+        return
+    _lesson_read_cache[key] = (time.monotonic(), value)
+    _lesson_read_cache.move_to_end(key)
+    while len(_lesson_read_cache) > LESSON_READ_CACHE_CAPACITY:
+        _lesson_read_cache.popitem(last=False)
+
+def invalidate_lesson_cache(lesson_id: int):
+    """Drop every cached read for lesson_id."""
+    for key in [k for k in _lesson_read_cache if k[1] == lesson_id]:
+        _lesson_read_cache.pop(key, None)
+
+# Ids handed out by insert_lesson when nothing was stored (no Supabase or a failed insert)
+_fallback_lesson_ids: set = set()
+
+def _fallback_lesson_id() -> int:
     global DUMMY_ID_COUNTER
+    DUMMY_ID_COUNTER += 1
+    _fallback_lesson_ids.add(DUMMY_ID_COUNTER)
+    return DUMMY_ID_COUNTER
+
+def is_persisted_lesson(lesson_id: int) -> bool:
+    """True if lesson_id came from an actual Supabase insert rather than a local fallback id."""
+    return SUPA is not None and lesson_id not in _fallback_lesson_ids
+
+def insert_lesson(owner_id: str, title: str, summary: str, framework: Framework = Framework.GENERIC, explanation_level: ExplanationLevel = ExplanationLevel.INTERN, full_text: str = None) -> int:
     if not SUPA:
         # Generate unique increasing ID for local/testing mode
-        DUMMY_ID_COUNTER += 1
-        lesson_id = DUMMY_ID_COUNTER
+        lesson_id = _fallback_lesson_id()
         logger.warning(f"Supabase not available. Using local lesson_id {lesson_id}.")
         return lesson_id
     
@@ -75,23 +117,23 @@ def insert_lesson(owner_id: str, title: str, summary: str, framework: Framework
         else:
             logger.error("Supabase returned empty data for lesson insert")
             # Fallback ID in production mode failure
-            DUMMY_ID_COUNTER += 1
-            return DUMMY_ID_COUNTER
+            return _fallback_lesson_id()
             
     except Exception as e:
         logger.error(f"Supabase insert_lesson failed: {e}")
         # Return unique fallback ID instead of raising exception
         logger.warning("Using unique fallback lesson_id due to Supabase failure")
-        DUMMY_ID_COUNTER += 1
-        return DUMMY_ID_COUNTER
+        return _fallback_lesson_id()
 
-def insert_cards(lesson_id: int, cards: list[dict]):
+def insert_cards(lesson_id: int, cards: list[dict]) -> bool:
+    """Insert lesson cards; returns False if they could not be stored."""
     if not SUPA:
         logger.warning("Supabase not available. Skipping card insertion.")
-        return
+        return False
     try:
         # Clean and validate card data
         cleaned_cards = []
+        created_at = datetime.utcnow().isoformat()
         for card in cards:
             if isinstance(card, dict):
                 # Ensure required fields exist
@@ -99,7 +141,7 @@ def insert_cards(lesson_id: int, cards: list[dict]):
                     "lesson_id": lesson_id,
                     "card_type": card.get("card_type", "unknown"),
                     "payload": card.get("payload", {}),
-                    "created_at": datetime.utcnow().isoformat()
+                    "created_at": created_at
                 }
                 # Add embed_vector if it exists and is valid
                 if "embed_vector" in card and isinstance(card["embed_vector"], list):
@@ -107,21 +149,25 @@ def insert_cards(lesson_id: int, cards: list[dict]):
                 cleaned_cards.append(cleaned_card)
         
         if cleaned_cards:
+            # One bulk insert for every card type; postgrest-py sends the union of row keys as columns=
             SUPA.table("lesson_metadata").insert(cleaned_cards).execute()
+            invalidate_lesson_cache(lesson_id)
             logger.info(f"Successfully inserted {len(cleaned_cards)} cards for lesson {lesson_id}")
         else:
             logger.warning("No valid cards to insert")
+        return True
             
     except Exception as e:
         logger.error(f"Supabase insert_cards failed: {e}")
         logger.warning("Continuing without card insertion due to Supabase failure")
         # Don't raise exception, just log and continue
+        return False
 
-def insert_concept_map(lesson_id: int, concept_map: Dict):
-    """Insert concept map data for a lesson."""
+def insert_concept_map(lesson_id: int, concept_map: Dict) -> bool:
+    """Insert concept map data for a lesson; returns False if it could not be stored."""
     if not SUPA:
         logger.warning("Supabase not available. Skipping concept map insertion.")
-        return
+        return False
     try:
         # Clean and validate concept map data
         clean_nodes = concept_map.get("nodes", []) if isinstance(concept_map, dict) else []
@@ -141,12 +187,15 @@ def insert_concept_map(lesson_id: int, concept_map: Dict):
         }
         
         SUPA.table("concept_maps").insert(insert_data).execute()
+        invalidate_lesson_cache(lesson_id)
         logger.info(f"Successfully inserted concept map for lesson {lesson_id}")
+        return True
         
     except Exception as e:
         logger.error(f"Supabase insert_concept_map failed: {e}")
         logger.warning("Continuing without concept map insertion due to Supabase failure")
         # Don't raise exception, just log and continue
+        return False
 
 def mark_lesson_completed(user_id: str, lesson_id: int, progress_percentage: float = 100.0):
     """Mark a lesson as completed for a user."""
@@ -260,10 +309,15 @@ def get_lesson_summary(lesson_id: int) -> Optional[str]:
     if not SUPA:
         logger.warning("Supabase not available. No summary available (trigger on-demand generation).")
         return None
+    cached = _read_cache_get(("summary", lesson_id))
+    if cached is not None:
+        return cached
     try:
         res = SUPA.table("lessons").select("summary").eq("id", lesson_id).execute()
         if res.data:
-            return res.data[0]["summary"]
+            summary = res.data[0]["summary"]
+            _read_cache_set(("summary", lesson_id), summary)
+            return summary
         return None
     except Exception as e:
         logger.error(f"Supabase get_lesson_summary failed: {e}")
@@ -276,8 +330,12 @@ def get_lesson_cards(lesson_id: int, card_type: str) -> List[Dict]:
     if not SUPA:
         logger.warning("Supabase not available. No cards available (trigger on-demand generation).")
         return []
+    cached = _read_cache_get(("cards", lesson_id, card_type))
+    if cached is not None:
+        return cached
     try:
         res = SUPA.table("lesson_metadata").select("*").eq("lesson_id", lesson_id).eq("card_type", card_type).execute()
+        _read_cache_set(("cards", lesson_id, card_type), res.data)
         return res.data
     except Exception as e:
         logger.error(f"Supabase get_lesson_cards failed: {e}")
@@ -290,9 +348,13 @@ def get_lesson_concept_map(lesson_id: int) -> Optional[Dict]:
     if not SUPA:
         logger.warning("Supabase not available. No concept map (trigger on-demand generation).")
         return None
+    cached = _read_cache_get(("concept_map", lesson_id))
+    if cached is not None:
+        return cached
     try:
         res = SUPA.table("concept_maps").select("*").eq("lesson_id", lesson_id).execute()
         if res.data:
+            _read_cache_set(("concept_map", lesson_id), res.data[0])
             return res.data[0]
         return None
     except Exception as e:
@@ -306,9 +368,13 @@ def get_lesson_by_id(lesson_id: int) -> Optional[Dict]:
     if not SUPA:
         logger.warning("Supabase not available. No lesson data (trigger on-demand generation).")
         return None
+    cached = _read_cache_get(("lesson", lesson_id))
+    if cached is not None:
+        return cached
     try:
         res = SUPA.table("lessons").select("*").eq("id", lesson_id).execute()
         if res.data:
+            _read_cache_set(("lesson", lesson_id), res.data[0])
             return res.data[0]
         return None
     except Exception as e: